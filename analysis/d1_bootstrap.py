@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+"""
+d1_bootstrap.py - Vectorized bootstrap of the combined D1 δ
+
+Draws point-level and/or series-level resamples as index arrays, refits the
+protection window and weighted slope of every resampled series with the
+batch engine, and combines each replicate's slopes with the meta-analysis
+core, so no Python loop runs per replicate. Series can be supplied in
+batches (e.g. streamed blocks of systems); every series draws its
+resamples from its own seed, so batching does not change the result.
+Reports percentile and BCa intervals for μ_FE and μ_RE.
+"""
+
+import numpy as np
+from scipy.stats import norm
+
+from d1_engine import fit_series_batch
+from meta import combine, dl_leave_one_out
+
+LEVELS = ('points', 'series', 'both')
+
+
+def draw_slot_series(k, n_boot, level, rng):
+    """
+    Series drawn into the k slots of each replicate, shape (n_boot, k)
+    Series-level resampling draws with replacement; otherwise slot j holds
+    series j
+    """
+    if level in ('series', 'both'):
+        return rng.integers(0, k, size=(n_boot, k))
+    return np.tile(np.arange(k), (n_boot, 1))
+
+
+def distinct_in_windows(values, slot_offsets, starts, ends):
+    """
+    Number of distinct values in each slot's window [start, end)
+    values are sorted within each slot; 0 where no window (start < 0)
+    """
+    values = np.asarray(values)
+    new = np.ones(len(values), dtype=bool)
+    new[1:] = values[1:] != values[:-1]
+    count = np.concatenate([[0], np.cumsum(new)])
+
+    has_window = starts >= 0
+    lo = slot_offsets[:-1] + np.where(has_window, starts, 0)
+    hi = slot_offsets[:-1] + np.where(has_window, ends, 1)
+    # The first point of a window is always new to it
+    return np.where(has_window, count[hi] - count[lo + 1] + 1, 0)
+
+
+def fit_slots(S_norm, tau, tau_err, point_index, slot_offsets, config):
+    """
+    Window + slope fit of each slot (points point_index, split by slot_offsets)
+
+    A slot's slope counts as valid only if a window is found, the fit
+    succeeds with a finite slope and SE > 0, the slope is at least
+    neg_slope_threshold (the inclusion rule of the main fit) and the window
+    holds at least min_points distinct S values. Point-level resampling
+    repeats points, so a window of duplicates can pass the window search
+    with a near-exact fit (SE ≈ 0) that would dominate the inverse-variance
+    weights. Returns (slopes, ses, valid).
+    """
+    S = S_norm[point_index]
+    starts, ends, slopes, ses, ok = fit_series_batch(
+        S, tau[point_index], None if tau_err is None else tau_err[point_index],
+        slot_offsets, **config)
+    distinct = distinct_in_windows(S, slot_offsets, starts, ends)
+    with np.errstate(invalid='ignore'):
+        valid = (ok & (starts >= 0) & np.isfinite(slopes) & np.isfinite(ses) & (ses > 0) &
+                 (slopes >= config['neg_slope_threshold']) &
+                 (distinct >= config['min_points']))
+    return slopes, ses, valid
+
+
+def refit_slots(S_norm, tau, tau_err, offsets, series_ids, slot_series, series_seeds,
+                resample=True, max_points=2000000, **config):
+    """
+    Replicate fits of every slot that draws one of the given series
+
+    The arrays hold the series with global ids series_ids, at local
+    offsets. Each series redraws its points for all of its slots, in
+    replicate order, from its own generator series_seeds[global id], so the
+    fits do not depend on how the series are split into batches. Without
+    resample (series-level bootstrap) a slot reuses its series' full-data
+    fit. Resampled slots are fitted in blocks of at most max_points points.
+
+    Returns (positions, slopes, ses, valid): flat indices into slot_series
+    and the fits of those slots.
+    """
+    offsets = np.asarray(offsets)
+    n_series = len(offsets) - 1
+    to_local = np.full(slot_series.shape[1], -1)
+    to_local[series_ids] = np.arange(n_series)
+    local = to_local[slot_series.ravel()]
+    positions = np.flatnonzero(local >= 0)
+    # Group by series, keeping replicate order within each series
+    positions = positions[np.argsort(local[positions], kind='stable')]
+    series_of = local[positions]
+
+    if not resample:
+        slopes, ses, valid = fit_slots(S_norm, tau, tau_err, np.arange(offsets[-1]), offsets, config)
+        return positions, slopes[series_of], ses[series_of], valid[series_of]
+
+    lengths = np.diff(offsets)
+    counts = np.bincount(series_of, minlength=n_series)
+    out = [np.empty(len(positions)), np.empty(len(positions)), np.empty(len(positions), dtype=bool)]
+    block, block_points, done = [], 0, 0
+
+    def flush():
+        nonlocal block, block_points, done
+        if not block:
+            return
+        point_index = np.concatenate([idx for idx, _ in block])
+        slot_lengths = np.concatenate([np.full(rows, n) for _, (rows, n) in block])
+        slot_offsets = np.concatenate([[0], np.cumsum(slot_lengths)])
+        fits = fit_slots(S_norm, tau, tau_err, point_index, slot_offsets, config)
+        for o, f in zip(out, fits):
+            o[done:done + len(slot_lengths)] = f
+        done += len(slot_lengths)
+        block, block_points = [], 0
+
+    for i in np.flatnonzero(counts):
+        rng = np.random.default_rng(series_seeds[series_ids[i]])
+        n = int(lengths[i])
+        rows_per_piece = max(1, max_points // max(n, 1))
+        for a in range(0, counts[i], rows_per_piece):
+            rows = min(rows_per_piece, counts[i] - a)
+            # Sorted ranks keep the points in S_norm order
+            ranks = np.sort((rng.random((rows, n)) * n).astype(np.int64), axis=1)
+            block.append(((offsets[i] + ranks).ravel(), (rows, n)))
+            block_points += rows * n
+            if block_points >= max_points:
+                flush()
+    flush()
+    return (positions, *out)
+
+
+def bootstrap_combined_batches(batches, k, n_boot, level='both', method='DL', seed=42,
+                               chunk=2000, max_points=2000000, **config):
+    """
+    Bootstrap distribution of μ_FE / μ_RE over k series read in batches
+
+    batches yields (S_norm, tau, tau_err, offsets, series_ids) tuples, with
+    series_ids the global ids (0..k-1) of the batch's series (e.g. one batch
+    per streamed block); only one batch is held at a time, plus O(n_boot × k)
+    per-slot fits. config holds the fit settings (see fit_d1.fit_config);
+    invalid slot fits are dropped as described in fit_slots. Returns dict
+    with mu_FE, mu_RE (length n_boot, NaN if fewer than two slopes survive
+    or the combination is not finite) and n_valid per replicate.
+    """
+    if level not in LEVELS:
+        raise ValueError(f"Unknown bootstrap level {level!r}; choose from {LEVELS}")
+
+    slot_seq, series_seq = np.random.SeedSequence(seed).spawn(2)
+    slot_series = draw_slot_series(k, n_boot, level, np.random.default_rng(slot_seq))
+    series_seeds = series_seq.spawn(k)
+
+    slopes = np.full(n_boot * k, np.nan)
+    ses = np.full(n_boot * k, np.nan)
+    valid = np.zeros(n_boot * k, dtype=bool)
+    seen = np.zeros(k, dtype=int)
+    for S_norm, tau, tau_err, offsets, series_ids in batches:
+        series_ids = np.asarray(series_ids, dtype=int)
+        seen[series_ids] += 1
+        positions, *fits = refit_slots(S_norm, tau, tau_err, offsets, series_ids, slot_series,
+                                       series_seeds, resample=level != 'series',
+                                       max_points=max_points, **config)
+        for out, f in zip((slopes, ses, valid), fits):
+            out[positions] = f
+    if np.any(seen != 1):
+        raise ValueError(f"Bootstrap batches must hold each of the {k} series exactly once")
+
+    slopes, ses, valid = (a.reshape(n_boot, k) for a in (slopes, ses, valid))
+    mu_FE, mu_RE = [], []
+    for a in range(0, n_boot, chunk):
+        v = valid[a:a + chunk]
+        c = combine(np.where(v, slopes[a:a + chunk], 0.0), np.where(v, ses[a:a + chunk], 1.0),
+                    method=method, mask=v)
+        enough = v.sum(axis=1) > 1
+        mu_FE.append(np.where(enough & np.isfinite(c['mu_FE']), c['mu_FE'], np.nan))
+        mu_RE.append(np.where(enough & np.isfinite(c['mu_RE']), c['mu_RE'], np.nan))
+
+    return {
+        'mu_FE': np.concatenate(mu_FE),
+        'mu_RE': np.concatenate(mu_RE),
+        'n_valid': valid.sum(axis=1),
+    }
+
+
+def bootstrap_combined(S_norm, tau, tau_err, offsets, n_boot, level='both',
+                       method='DL', seed=42, chunk=2000, **config):
+    """bootstrap_combined_batches over in-memory series (a single batch)"""
+    k = len(offsets) - 1
+    return bootstrap_combined_batches([(S_norm, tau, tau_err, offsets, np.arange(k))], k,
+                                      n_boot, level=level, method=method, seed=seed,
+                                      chunk=chunk, **config)
+
+
+def _require_finite(samples):
+    samples = np.asarray(samples, dtype=float)
+    if not np.all(np.isfinite(samples)):
+        raise ValueError(f"{np.sum(~np.isfinite(samples))} non-finite bootstrap replicates; "
+                         "drop failed replicates explicitly (see bootstrap_summary)")
+    return samples
+
+
+def percentile_interval(samples, alpha=0.05):
+    """Equal-tailed percentile interval of finite replicates"""
+    samples = _require_finite(samples)
+    return tuple(np.percentile(samples, [100 * alpha / 2, 100 * (1 - alpha / 2)]))
+
+
+def bca_interval(samples, estimate, jackknife, alpha=0.05):
+    """
+    Bias-corrected and accelerated interval
+
+    Bias correction from the share of replicates below the estimate;
+    acceleration from the jackknife (drop-one-series) estimates. samples
+    must be finite.
+    """
+    samples = _require_finite(samples)
+    jackknife = np.asarray(jackknife, dtype=float)
+    jackknife = jackknife[np.isfinite(jackknife)]
+    if len(samples) == 0:
+        return (np.nan, np.nan)
+
+    below = np.mean(samples < estimate)
+    z0 = norm.ppf(np.clip(below, 1 / len(samples), 1 - 1 / len(samples)))
+
+    d = jackknife.mean() - jackknife
+    denom = 6 * np.sum(d ** 2) ** 1.5
+    acc = np.sum(d ** 3) / denom if denom > 0 else 0.0
+
+    z = norm.ppf([alpha / 2, 1 - alpha / 2])
+    adjusted = norm.cdf(z0 + (z0 + z) / (1 - acc * (z0 + z)))
+    return tuple(np.percentile(samples, 100 * adjusted))
+
+
+def bootstrap_summary(boot, slopes, ses, combined, method='DL', alpha=0.05,
+                      max_fail_fraction=0.05):
+    """
+    Table rows for d1_bootstrap_delta: one per estimator (μ_FE, μ_RE)
+    combined is the full-data combine_effects result
+
+    Failed replicates (NaN or infinite) are excluded from the intervals and
+    reported as n_failed / fail_fraction. Raises RuntimeError if more than
+    max_fail_fraction of the replicates failed, since the intervals would
+    then describe a selected subset of resamples.
+    """
+    jack = dl_leave_one_out(slopes, ses) if method == 'DL' else None
+    rows = []
+    for name, key, jack_key in (('μ_FE', 'mu_FE', 'mu_FE'), ('μ_RE', 'mu_RE', 'mu_RE')):
+        samples = np.asarray(boot[key], dtype=float)
+        finite = np.isfinite(samples)
+        fail_fraction = 1 - finite.mean() if len(samples) else 1.0
+        if fail_fraction > max_fail_fraction:
+            raise RuntimeError(f"{name}: {np.sum(~finite)} of {len(samples)} bootstrap replicates "
+                               f"failed ({fail_fraction:.1%} > {max_fail_fraction:.1%})")
+        samples = samples[finite]
+        if jack is None:
+            # Non-DL estimators: jackknife by direct refits (k is small)
+            k = len(slopes)
+            drop = ~np.eye(k, dtype=bool)
+            y = np.broadcast_to(np.asarray(slopes, dtype=float), (k, k))
+            s = np.broadcast_to(np.asarray(ses, dtype=float), (k, k))
+            jack_values = combine(y, s, method=method, mask=drop)[jack_key]
+        else:
+            jack_values = jack[jack_key]
+
+        pct_lo, pct_hi = percentile_interval(samples, alpha)
+        bca_lo, bca_hi = bca_interval(samples, combined[name], jack_values, alpha)
+        rows.append({
+            'estimator': name,
+            'estimate': combined[name],
+            'boot_mean': samples.mean(),
+            'boot_se': samples.std(ddof=1),
+            'pct_lo': pct_lo, 'pct_hi': pct_hi,
+            'bca_lo': bca_lo, 'bca_hi': bca_hi,
+            'n_boot': len(finite),
+            'n_failed': int(np.sum(~finite)),
+            'fail_fraction': fail_fraction,
+        })
+    return rows
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+d1_cache.py - Content-addressed cache for per-series D1 fits
+
+Each series is keyed by a SHA-256 of its sorted (S_norm, tau, tau_err) arrays
+plus the fit configuration, so reruns only refit series whose points or
+settings changed. Entries (window bounds, slope, SE) live in a single SQLite
+file with least-recently-used eviction.
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Bump when the fitting code changes in a way that alters results
+CACHE_VERSION = 1
+
+# Keep well under SQLite's bound-parameter limit
+_QUERY_CHUNK = 500
+
+
+def config_digest(config):
+    """Stable digest of the fit configuration dict"""
+    blob = json.dumps({'version': CACHE_VERSION, **config}, sort_keys=True)
+    return hashlib.sha256(blob.encode()).digest()
+
+
+def series_key(S_norm, tau, tau_err, config_hash):
+    """Hex key for one series' sorted arrays under a config digest"""
+    h = hashlib.sha256(config_hash)
+    h.update(np.ascontiguousarray(S_norm, dtype=float).tobytes())
+    h.update(b'|')
+    h.update(np.ascontiguousarray(tau, dtype=float).tobytes())
+    h.update(b'|')
+    if tau_err is None:
+        h.update(b'no-tau-err')
+    else:
+        h.update(np.ascontiguousarray(tau_err, dtype=float).tobytes())
+    return h.hexdigest()
+
+
+class FitCache:
+    """On-disk LRU store of (start, end, slope, slope_se, ok) per series key"""
+
+    def __init__(self, path, max_entries=200000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS fits (
+                key TEXT PRIMARY KEY,
+                start INTEGER, end INTEGER,
+                slope REAL, slope_se REAL, ok INTEGER,
+                last_used REAL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS fits_lru ON fits (last_used)")
+        self.conn.commit()
+
+    def get_many(self, keys):
+        """Look up keys; returns dict key -> (start, end, slope, slope_se, ok)"""
+        found = {}
+        keys = list(keys)
+        for i in range(0, len(keys), _QUERY_CHUNK):
+            chunk = keys[i:i + _QUERY_CHUNK]
+            marks = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key, start, end, slope, slope_se, ok FROM fits WHERE key IN ({marks})",
+                chunk).fetchall()
+            for key, start, end, slope, slope_se, ok in rows:
+                found[key] = (start, end,
+                              np.nan if slope is None else slope,
+                              np.nan if slope_se is None else slope_se,
+                              bool(ok))
+
+        # Touch hits for LRU ordering
+        now = time.time()
+        self.conn.executemany("UPDATE fits SET last_used = ? WHERE key = ?",
+                              [(now, k) for k in found])
+        self.conn.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, entries):
+        """Store entries: iterable of (key, start, end, slope, slope_se, ok)"""
+        now = time.time()
+        rows = []
+        for key, start, end, slope, slope_se, ok in entries:
+            # SQLite stores NaN as NULL; get_many maps it back
+            rows.append((key, int(start), int(end),
+                         None if np.isnan(slope) else float(slope),
+                         None if np.isnan(slope_se) else float(slope_se),
+                         int(bool(ok)), now))
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO fits VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self.conn.commit()
+        self.evict()
+
+    def evict(self):
+        """Drop least-recently-used entries beyond max_entries"""
+        if not self.max_entries:
+            return 0
+        n = self.conn.execute("SELECT COUNT(*) FROM fits").fetchone()[0]
+        excess = n - self.max_entries
+        if excess <= 0:
+            return 0
+        self.conn.execute(
+            "DELETE FROM fits WHERE key IN "
+            "(SELECT key FROM fits ORDER BY last_used ASC LIMIT ?)", (excess,))
+        self.conn.commit()
+        return excess
+
+    def close(self):
+        self.conn.close()
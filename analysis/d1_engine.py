@@ -0,0 +1,460 @@
+#!/usr/bin/env python
+"""
+d1_engine.py - Array kernels for the D1 decoherence fits
+
+NumPy implementations of the per-series work done by fit_d1.py, operating on
+plain sorted arrays instead of pandas slices so they can be reused by batch,
+parallel and bootstrap drivers.
+"""
+
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def find_protection_window(x, y, min_points, min_log_range_x, min_log_range_y,
+                           neg_slope_threshold):
+    """
+    Locate the protection window on log-log data sorted by x
+
+    Returns (start, end) of the longest window [start, end) whose OLS slope
+    exceeds neg_slope_threshold and whose x/y log ranges meet the minimums,
+    preferring the earliest start among equally long windows (the same window
+    the exhaustive search in fit_d1 picks). Returns None if no window passes.
+
+    Windows are scanned longest-first; for each length the window slides over
+    the series updating running sums (Σx, Σy, Σxy, Σx²) and monotone deques
+    for min/max(y) in O(1), so the search is O(n²) worst case and stops at the
+    first length that yields a valid window.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n < min_points:
+        return None
+
+    # Windows containing non-finite values never pass the original checks
+    bad = ~(np.isfinite(x) & np.isfinite(y))
+    bad_prefix = np.concatenate([[0], np.cumsum(bad)])
+
+    # Center once to limit cancellation in the running sums
+    finite = ~bad
+    xc = x - (x[finite].mean() if finite.any() else 0.0)
+    yc = y - (y[finite].mean() if finite.any() else 0.0)
+    xc[bad] = 0.0
+    yc[bad] = 0.0
+    # Deque keys: bad points lose every min/max comparison (their windows are skipped)
+    ylo = np.where(bad, np.inf, y)
+    yhi = np.where(bad, -np.inf, y)
+
+    for length in range(n, min_points - 1, -1):
+        sx = xc[:length].sum()
+        sy = yc[:length].sum()
+        sxy = (xc[:length] * yc[:length]).sum()
+        sxx = (xc[:length] ** 2).sum()
+
+        # Monotone deques of indices: y increasing (min) / decreasing (max)
+        qmin, qmax = deque(), deque()
+        for i in range(length):
+            while qmin and ylo[qmin[-1]] >= ylo[i]:
+                qmin.pop()
+            qmin.append(i)
+            while qmax and yhi[qmax[-1]] <= yhi[i]:
+                qmax.pop()
+            qmax.append(i)
+
+        for start in range(n - length + 1):
+            end = start + length
+            if start > 0:
+                # Slide: drop start-1, add end-1
+                old, new = start - 1, end - 1
+                sx += xc[new] - xc[old]
+                sy += yc[new] - yc[old]
+                sxy += xc[new] * yc[new] - xc[old] * yc[old]
+                sxx += xc[new] ** 2 - xc[old] ** 2
+                while qmin and qmin[0] < start:
+                    qmin.popleft()
+                while qmax and qmax[0] < start:
+                    qmax.popleft()
+                while qmin and ylo[qmin[-1]] >= ylo[new]:
+                    qmin.pop()
+                qmin.append(new)
+                while qmax and yhi[qmax[-1]] <= yhi[new]:
+                    qmax.pop()
+                qmax.append(new)
+
+            if bad_prefix[end] - bad_prefix[start]:
+                continue
+
+            x_range = x[end - 1] - x[start]
+            y_range = y[qmax[0]] - y[qmin[0]]
+            if x_range < min_log_range_x or y_range < min_log_range_y:
+                continue
+
+            denom = length * sxx - sx * sx
+            if denom <= 0:
+                continue
+            slope = (length * sxy - sx * sy) / denom
+            if slope > neg_slope_threshold:
+                return start, end
+
+    return None
+
+
+# Per-series fit outcome shared by the serial and batch drivers.
+# window_S/window_tau are the sorted points inside the protection window
+# (None if no window was found); slope/slope_se are None if the fit failed.
+SeriesFit = namedtuple('SeriesFit', ['n_points', 'window_S', 'window_tau',
+                                     'slope', 'slope_se'])
+
+
+def length_buckets(lengths):
+    """
+    Group series by padded length (next power of two)
+    Returns list of (row_indices, n_pad); padding waste is at most 2×
+    """
+    lengths = np.asarray(lengths)
+    n_pad = np.ones(len(lengths), dtype=int)
+    nonzero = lengths > 1
+    n_pad[nonzero] = 2 ** np.ceil(np.log2(lengths[nonzero])).astype(int)
+    return [(np.flatnonzero(n_pad == p), p) for p in np.unique(n_pad)]
+
+
+def pad_ragged(values, offsets, rows, n_pad, fill=np.nan):
+    """Copy ragged rows values[offsets[r]:offsets[r+1]] into a (len(rows), n_pad) array"""
+    out = np.full((len(rows), n_pad), fill, dtype=float)
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    col = np.arange(n_pad)
+    mask = col[None, :] < lengths[:, None]
+    src = (starts[:, None] + col[None, :])[mask]
+    out[mask] = values[src]
+    return out
+
+
+def _sparse_table(values, reduce):
+    """Range-min/max table: level k holds reduce over [i, i + 2**k)"""
+    table = [values]
+    width = 1
+    while 2 * width <= values.shape[1]:
+        prev = table[-1]
+        level = prev.copy()
+        level[:, :-width] = reduce(prev[:, :-width], prev[:, width:])
+        table.append(level)
+        width *= 2
+    return table
+
+
+def batch_protection_windows(x, y, lengths, min_points, min_log_range_x,
+                             min_log_range_y, neg_slope_threshold):
+    """
+    Vectorized find_protection_window over padded rows
+
+    x, y: (B, n_pad) log-log data, each row sorted by x in its first
+    lengths[b] columns. Returns (starts, ends) int arrays, -1 where no window
+    passes. Every candidate window of a given length is evaluated for all rows
+    at once from prefix sums, with range min/max(y) answered in O(1) from a
+    sparse table; lengths are scanned longest-first so each row keeps the
+    first (longest, earliest) valid window.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    lengths = np.asarray(lengths)
+    n_rows, n_pad = x.shape
+    starts = np.full(n_rows, -1, dtype=int)
+    ends = np.full(n_rows, -1, dtype=int)
+    if n_rows == 0:
+        return starts, ends
+
+    col = np.arange(n_pad)
+    inside = col[None, :] < lengths[:, None]
+    bad = inside & ~(np.isfinite(x) & np.isfinite(y))
+    good = inside & ~bad
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        n_good = good.sum(axis=1)
+        x0 = np.where(good, x, 0.0).sum(axis=1) / np.maximum(n_good, 1)
+        y0 = np.where(good, y, 0.0).sum(axis=1) / np.maximum(n_good, 1)
+    xc = np.where(good, x - x0[:, None], 0.0)
+    yc = np.where(good, y - y0[:, None], 0.0)
+
+    def prefix(a):
+        return np.concatenate([np.zeros((n_rows, 1)), np.cumsum(a, axis=1)], axis=1)
+
+    p_x, p_y = prefix(xc), prefix(yc)
+    p_xy, p_xx = prefix(xc * yc), prefix(xc * xc)
+    p_bad = prefix(bad.astype(float))
+
+    y_min = _sparse_table(np.where(good, y, np.inf), np.minimum)
+    y_max = _sparse_table(np.where(good, y, -np.inf), np.maximum)
+
+    for length in range(n_pad, min_points - 1, -1):
+        pending = np.flatnonzero((starts < 0) & (lengths >= length))
+        if len(pending) == 0:
+            continue
+
+        s = np.arange(n_pad - length + 1)
+        e = s + length
+        r = pending[:, None]
+        in_range = e[None, :] <= lengths[pending, None]
+
+        def window_sum(p):
+            return p[r, e[None, :]] - p[r, s[None, :]]
+
+        sx, sy = window_sum(p_x), window_sum(p_y)
+        sxy, sxx = window_sum(p_xy), window_sum(p_xx)
+        n_bad = window_sum(p_bad)
+
+        level = int(np.log2(length))
+        width = 2 ** level
+        lo = np.minimum(y_min[level][r, s[None, :]], y_min[level][r, (e - width)[None, :]])
+        hi = np.maximum(y_max[level][r, s[None, :]], y_max[level][r, (e - width)[None, :]])
+
+        x_range = x[r, (e - 1)[None, :]] - x[r, s[None, :]]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            denom = length * sxx - sx * sx
+            slope = (length * sxy - sx * sy) / denom
+            ok = (in_range & (n_bad == 0) &
+                  (x_range >= min_log_range_x) & (hi - lo >= min_log_range_y) &
+                  (denom > 0) & (slope > neg_slope_threshold))
+
+        found = ok.any(axis=1)
+        first = ok.argmax(axis=1)
+        starts[pending[found]] = first[found]
+        ends[pending[found]] = first[found] + length
+
+    return starts, ends
+
+
+def wls_slope(x, y, weights, mask=None):
+    """
+    Closed-form weighted least squares slope along the last axis
+
+    Fits y = a·x + b for every series stacked in the leading axes of x, y and
+    weights (which broadcast against each other) from the weighted moments
+    Σw, Σwx, Σwy, Σwx², Σwxy — O(n) per series, no n×n weight matrix.
+    mask optionally selects the points of each series; weights are used as
+    given inside it (NaNs propagate, as in the dense per-series fit).
+
+    Returns (slope, slope_se, ok) with the leading shape. slope_se is the
+    usual s²·(XᵀWX)⁻¹ term with s² = Σw·r² / (n - 2); ok is False where the
+    normal equations are singular.
+    """
+    x, y, weights = np.broadcast_arrays(np.asarray(x, dtype=float),
+                                        np.asarray(y, dtype=float),
+                                        np.asarray(weights, dtype=float))
+    if mask is None:
+        mask = np.ones(x.shape, dtype=bool)
+    mask = np.broadcast_to(mask, x.shape)
+
+    xm = np.where(mask, x, 0.0)
+    ym = np.where(mask, y, 0.0)
+    wm = np.where(mask, weights, 0.0)
+    n = mask.sum(axis=-1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sw = wm.sum(axis=-1)
+        swx = (wm * xm).sum(axis=-1)
+        swy = (wm * ym).sum(axis=-1)
+        swxx = (wm * xm * xm).sum(axis=-1)
+        swxy = (wm * xm * ym).sum(axis=-1)
+
+        det = sw * swxx - swx * swx
+        slope = (sw * swxy - swx * swy) / det
+        intercept = (swxx * swy - swx * swxy) / det
+
+        resid = np.where(mask, ym - slope[..., None] * xm - intercept[..., None], 0.0)
+        s2 = (wm * resid ** 2).sum(axis=-1) / (n - 2)
+        slope_se = np.sqrt(s2 * sw / det)
+
+    return slope, slope_se, det != 0
+
+
+def loglog_weights(tau, tau_err, mask, rel_err_floor, eps):
+    """
+    Log-space WLS weights from τ errors, along the last axis
+
+    σ_y ≈ τ_err / τ for log(τ), floored at rel_err_floor, and weights
+    1/σ_y² normalized to sum to the number of points in mask. Series with no
+    non-NaN tau_err inside mask (or tau_err None) get unit weights.
+    """
+    tau = np.asarray(tau, dtype=float)
+    weights = np.ones(tau.shape)
+    if tau_err is None:
+        return weights
+
+    tau_err = np.asarray(tau_err, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sigma_y = np.clip(tau_err / np.clip(tau, eps, None), rel_err_floor, 1e6)
+        w = 1.0 / sigma_y ** 2
+        w_sum = np.where(mask, w, 0.0).sum(axis=-1, keepdims=True)
+        w = w / w_sum * mask.sum(axis=-1, keepdims=True)
+
+    use_err = (mask & ~np.isnan(tau_err)).any(axis=-1, keepdims=True)
+    return np.where(use_err, w, weights)
+
+
+def loglog_wls(S_norm, tau, tau_err=None, mask=None, rel_err_floor=0.10, eps=1e-12):
+    """
+    Weighted log-log slope of τ vs S_norm for one or many series
+
+    Works like a gufunc with signature (n),(n),(n)->(),(),(): the last axis
+    holds the points of a series and any leading axes stack series. Padding
+    can be excluded with mask. Returns (slope, slope_se, ok) as in wls_slope.
+    """
+    S_norm = np.asarray(S_norm, dtype=float)
+    tau = np.asarray(tau, dtype=float)
+    if mask is None:
+        mask = np.ones(tau.shape, dtype=bool)
+
+    x = np.log(S_norm + eps)
+    y = np.log(tau + eps)
+    weights = loglog_weights(tau, tau_err, mask, rel_err_floor, eps)
+    return wls_slope(x, y, weights, mask)
+
+
+def fit_series_batch(S_norm, tau, tau_err, offsets, min_points, min_log_range_x,
+                     min_log_range_y, neg_slope_threshold, rel_err_floor, eps):
+    """
+    Window selection + weighted slope fit for every series in one pass
+
+    S_norm, tau, tau_err: concatenated per-series arrays, each series sorted by
+    S_norm and occupying [offsets[i], offsets[i+1]). tau_err may be None when
+    the catalogue has no error column. Returns (starts, ends, slopes, ses, ok)
+    with window bounds local to each series (-1 if none) and ok False where no
+    window was found or the fit was singular.
+    """
+    offsets = np.asarray(offsets)
+    lengths = np.diff(offsets)
+    n_series = len(lengths)
+    starts = np.full(n_series, -1, dtype=int)
+    ends = np.full(n_series, -1, dtype=int)
+    slopes = np.full(n_series, np.nan)
+    ses = np.full(n_series, np.nan)
+    ok = np.zeros(n_series, dtype=bool)
+
+    x_all = np.log(np.asarray(S_norm, dtype=float) + eps)
+    y_all = np.log(np.asarray(tau, dtype=float) + eps)
+
+    for rows, n_pad in length_buckets(lengths):
+        rows = rows[lengths[rows] >= min_points]
+        if len(rows) == 0:
+            continue
+
+        x = pad_ragged(x_all, offsets, rows, n_pad)
+        y = pad_ragged(y_all, offsets, rows, n_pad)
+        s, e = batch_protection_windows(x, y, lengths[rows], min_points,
+                                        min_log_range_x, min_log_range_y,
+                                        neg_slope_threshold)
+        has_window = s >= 0
+        starts[rows], ends[rows] = s, e
+        if not has_window.any():
+            continue
+
+        rows, s, e = rows[has_window], s[has_window], e[has_window]
+        col = np.arange(n_pad)
+        mask = (col[None, :] >= s[:, None]) & (col[None, :] < e[:, None])
+
+        t = pad_ragged(np.asarray(tau, dtype=float), offsets, rows, n_pad)
+        t_err = None
+        if tau_err is not None:
+            t_err = pad_ragged(np.asarray(tau_err, dtype=float), offsets, rows, n_pad)
+        weights = loglog_weights(t, t_err, mask, rel_err_floor, eps)
+
+        slope, slope_se, fit_ok = wls_slope(x[has_window], y[has_window], weights, mask)
+        slopes[rows], ses[rows], ok[rows] = slope, slope_se, fit_ok
+
+    return starts, ends, slopes, ses, ok
+
+
+def fit_series_loop(S_norm, tau, tau_err, offsets, min_points, min_log_range_x,
+                    min_log_range_y, neg_slope_threshold, rel_err_floor, eps):
+    """
+    Per-series counterpart of fit_series_batch (same inputs and outputs)
+    Uses find_protection_window + loglog_wls on each series in turn
+    """
+    S_norm = np.asarray(S_norm, dtype=float)
+    tau = np.asarray(tau, dtype=float)
+    offsets = np.asarray(offsets)
+    n_series = len(offsets) - 1
+    starts = np.full(n_series, -1, dtype=int)
+    ends = np.full(n_series, -1, dtype=int)
+    slopes = np.full(n_series, np.nan)
+    ses = np.full(n_series, np.nan)
+    ok = np.zeros(n_series, dtype=bool)
+
+    for i in range(n_series):
+        lo, hi = offsets[i], offsets[i + 1]
+        if hi - lo < min_points:
+            continue
+
+        x = np.log(S_norm[lo:hi] + eps)
+        y = np.log(tau[lo:hi] + eps)
+        bounds = find_protection_window(x, y, min_points, min_log_range_x,
+                                        min_log_range_y, neg_slope_threshold)
+        if bounds is None:
+            continue
+
+        starts[i], ends[i] = bounds
+        window = slice(lo + bounds[0], lo + bounds[1])
+        err = None if tau_err is None else tau_err[window]
+        slopes[i], ses[i], ok[i] = loglog_wls(S_norm[window], tau[window], err,
+                                              rel_err_floor=rel_err_floor, eps=eps)
+
+    return starts, ends, slopes, ses, ok
+
+
+def take_series(offsets, rows):
+    """
+    Gather a subset of ragged series
+    Returns (point_index, new_offsets) so values[point_index] holds the
+    selected series back to back
+    """
+    offsets = np.asarray(offsets)
+    rows = np.asarray(rows, dtype=int)
+    lengths = offsets[rows + 1] - offsets[rows]
+    new_offsets = np.concatenate([[0], np.cumsum(lengths)])
+    point_index = (np.repeat(offsets[rows] - new_offsets[:-1], lengths) +
+                   np.arange(new_offsets[-1]))
+    return point_index, new_offsets
+
+
+def shard_series(offsets, n_shards):
+    """
+    Split series into at most n_shards contiguous runs of similar point count
+    Returns list of (first_series, last_series_exclusive)
+    """
+    offsets = np.asarray(offsets)
+    targets = np.linspace(0, offsets[-1], n_shards + 1)
+    cuts = np.unique(np.searchsorted(offsets, targets))
+    cuts = np.clip(cuts, 0, len(offsets) - 1)
+    cuts = np.unique(np.concatenate([[0], cuts, [len(offsets) - 1]]))
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def fit_series_parallel(S_norm, tau, tau_err, offsets, jobs, batch=True, **config):
+    """
+    Run fit_series_batch (or fit_series_loop) over shards in a process pool
+
+    Workers receive only the array slices of their shard plus the fit
+    configuration; shard results are gathered in submission order, so the
+    output is identical to a single-process run.
+    """
+    fitter = fit_series_batch if batch else fit_series_loop
+    offsets = np.asarray(offsets)
+    if jobs <= 1 or len(offsets) <= 2:
+        return fitter(S_norm, tau, tau_err, offsets, **config)
+
+    futures = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        # Several shards per worker keeps the pool busy when series sizes vary
+        for first, last in shard_series(offsets, 4 * jobs):
+            lo, hi = offsets[first], offsets[last]
+            futures.append(pool.submit(
+                fitter, S_norm[lo:hi], tau[lo:hi],
+                None if tau_err is None else tau_err[lo:hi],
+                offsets[first:last + 1] - lo, **config))
+        parts = [f.result() for f in futures]
+
+    return tuple(np.concatenate(column) for column in zip(*parts))
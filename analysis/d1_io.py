@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+"""
+d1_io.py - Input/output helpers for the D1 decoherence pipeline
+
+Pluggable table I/O (CSV, Parquet via pyarrow, or uncompressed .npz chosen by
+file suffix) and streaming readers for large point catalogues, so fit_d1.py
+can process instrument dumps that do not fit in memory.
+
+Usage (convert existing artifacts):
+    python analysis/d1_io.py artifacts/csv --to parquet
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Parquet support is optional
+try:
+    import pyarrow.parquet as pq
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+FORMATS = {'csv': '.csv', 'parquet': '.parquet', 'npz': '.npz'}
+
+# .npz key of the missing-value mask stored next to a text column
+NPZ_MISSING = '{}__missing'
+
+
+def table_format(path):
+    """Format name from a file suffix (anything unknown is read as CSV)"""
+    suffix = Path(path).suffix.lower()
+    for name, ext in FORMATS.items():
+        if suffix == ext:
+            return name
+    return 'csv'
+
+
+def _require_parquet():
+    if not HAS_PARQUET:
+        raise ImportError("Parquet I/O needs pyarrow (conda install pyarrow); "
+                          "use CSV or .npz instead")
+
+
+def read_table(path, columns=None):
+    """Read a CSV, Parquet or .npz table into a DataFrame"""
+    fmt = table_format(path)
+    if fmt == 'parquet':
+        _require_parquet()
+        return pd.read_parquet(path, columns=columns)
+    if fmt == 'npz':
+        with np.load(path, allow_pickle=False) as data:
+            masks = {NPZ_MISSING.format(name) for name in data.files}
+            names = columns if columns is not None else [n for n in data.files if n not in masks]
+            table = {}
+            for name in names:
+                values = data[name]
+                if NPZ_MISSING.format(name) in data.files:
+                    values = values.astype(object)
+                    values[data[NPZ_MISSING.format(name)]] = np.nan
+                table[name] = values
+            return pd.DataFrame(table)
+    return pd.read_csv(path, usecols=columns)
+
+
+def write_table(df, path):
+    """
+    Write a DataFrame as CSV, Parquet or .npz according to the path suffix
+    .npz files are stored uncompressed with one typed array per column;
+    text columns become fixed-width unicode arrays, with missing values
+    kept in a boolean <name>__missing mask so they read back as NaN
+    """
+    fmt = table_format(path)
+    if fmt == 'parquet':
+        _require_parquet()
+        df.to_parquet(path, index=False)
+    elif fmt == 'npz':
+        arrays = {}
+        for name in df.columns:
+            col = df[name]
+            if col.dtype == object or pd.api.types.is_string_dtype(col):
+                missing = col.isna().to_numpy()
+                arrays[str(name)] = np.array(col.where(~missing, '').astype(str).tolist(), dtype=str)
+                if missing.any():
+                    arrays[NPZ_MISSING.format(name)] = missing
+            else:
+                arrays[str(name)] = col.to_numpy()
+        np.savez(path, **arrays)
+    else:
+        df.to_csv(path, index=False)
+    return Path(path)
+
+
+class TableStreamWriter:
+    """
+    Append DataFrame batches to a table as they arrive
+    Parquet batches become row groups and CSV batches are appended, so
+    partial results are on disk while a long job runs; .npz has no append
+    mode and is written on close. Columns follow the first batch.
+    """
+    
+    def __init__(self, path):
+        self.path = Path(path)
+        self.fmt = table_format(path)
+        if self.fmt == 'parquet':
+            _require_parquet()
+        self.columns = None
+        self.n_rows = 0
+        self._writer = None
+        self._parts = []
+    
+    def write(self, df):
+        if self.columns is None:
+            self.columns = list(df.columns)
+        df = df.reindex(columns=self.columns)
+        
+        if self.fmt == 'parquet':
+            import pyarrow as pa
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(str(self.path), table.schema)
+            else:
+                table = table.cast(self._writer.schema)
+            self._writer.write_table(table)
+        elif self.fmt == 'npz':
+            self._parts.append(df)
+        else:
+            df.to_csv(self.path, mode='a' if self.n_rows else 'w',
+                      header=not self.n_rows, index=False)
+        self.n_rows += len(df)
+    
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._parts:
+            write_table(pd.concat(self._parts, ignore_index=True), self.path)
+        return self.path
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_table_chunks(path, chunksize):
+    """Yield a table in DataFrame chunks (Parquet row batches, CSV chunks)"""
+    fmt = table_format(path)
+    if fmt == 'parquet':
+        _require_parquet()
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    elif fmt == 'npz':
+        # .npz members are loaded whole; there is nothing to stream
+        yield read_table(path)
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
+
+
+def iter_point_batches(points_path, chunksize=100000, key='system_id'):
+    """
+    Stream a points table in batches of complete series
+
+    The file must be grouped by key (all rows of a system contiguous, e.g.
+    sorted by system_id). Yields DataFrames holding whole key blocks, about
+    chunksize rows each; a block longer than chunksize is carried over until
+    it is complete, so peak memory is bounded by max(chunksize, largest
+    system) rather than the full catalogue.
+    """
+    seen = set()
+    pending = []  # pieces of the trailing, possibly incomplete block
+
+    def check_blocks(block_keys):
+        for k in block_keys:
+            if pd.isna(k):
+                continue
+            if k in seen:
+                raise ValueError(
+                    f"{points_path} is not grouped by {key}: {key}={k} appears in "
+                    f"more than one block; sort the file by {key} before streaming")
+            seen.add(k)
+
+    for chunk in iter_table_chunks(points_path, chunksize):
+        if key not in chunk.columns:
+            raise ValueError(f"points missing columns: {{'{key}'}}")
+        keys = chunk[key].values
+
+        # Block boundaries inside this chunk
+        change = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        continues_pending = bool(pending) and keys[0] == pending[-1][key].values[-1]
+
+        if len(change) == 0 and (continues_pending or not pending):
+            pending.append(chunk)
+            continue
+
+        # Everything before the last boundary is complete
+        last_start = change[-1] if len(change) else 0
+        head = pd.concat(pending + [chunk.iloc[:last_start]], ignore_index=True)
+        pending = [chunk.iloc[last_start:]]
+
+        head_keys = head[key].values
+        starts = np.concatenate([[0], np.flatnonzero(head_keys[1:] != head_keys[:-1]) + 1])
+        check_blocks(head_keys[starts])
+        yield head
+
+    if pending:
+        tail = pd.concat(pending, ignore_index=True)
+        check_blocks(tail[key].values[:1])
+        yield tail
+
+
+def convert_tables(src, fmt, outdir=None):
+    """
+    Convert every CSV in src (a file or directory) to fmt
+    Outputs go next to the inputs unless outdir is given; returns written paths
+    """
+    src = Path(src)
+    inputs = sorted(src.glob('*.csv')) if src.is_dir() else [src]
+    outdir = Path(outdir) if outdir else None
+    written = []
+    for path in inputs:
+        target_dir = outdir if outdir else path.parent
+        target_dir.mkdir(parents=True, exist_ok=True)
+        target = target_dir / (path.stem + FORMATS[fmt])
+        written.append(write_table(pd.read_csv(path), target))
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert D1 CSV tables to a columnar format')
+    parser.add_argument('src', help='CSV file or directory of CSVs (e.g. artifacts/csv)')
+    parser.add_argument('--to', dest='fmt', choices=['parquet', 'npz'], default='parquet',
+                        help='Target format')
+    parser.add_argument('--outdir', default=None,
+                        help='Output directory (default: alongside inputs)')
+    args = parser.parse_args()
+    
+    try:
+        written = convert_tables(args.src, args.fmt, args.outdir)
+    except ImportError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    
+    for path in written:
+        print(f"✓ {path}")
+    print(f"Converted {len(written)} tables to {args.fmt}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+"""
+d1_plots.py - Deferred figure rendering for the D1 decoherence fits
+
+fit_d1.py records lightweight plot specs (arrays plus labels) while fitting
+and renders them afterwards, optionally in a pool of worker processes using
+the Agg backend. matplotlib is only imported when something is rendered, so
+headless refits with plotting disabled never pay its import cost.
+"""
+
+import importlib.util
+import pickle
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+
+# kind: 'series' | 'histogram' | 'summary'; data: dict of arrays/scalars
+PlotSpec = namedtuple('PlotSpec', ['kind', 'path', 'data'])
+
+
+def have_matplotlib():
+    """Check matplotlib is installed without importing it"""
+    return importlib.util.find_spec('matplotlib') is not None
+
+
+def _pyplot():
+    """Import pyplot on the non-interactive Agg backend with the D1 style"""
+    import matplotlib
+    matplotlib.use('Agg')
+    matplotlib.rcParams['figure.dpi'] = 100
+    matplotlib.rcParams['font.size'] = 10
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def render_series(path, S_norm, tau, system_id, env_tag, slope, slope_se):
+    """Plot log-log data with fit line"""
+    plt = _pyplot()
+    fig, ax = plt.subplots(1, 1, figsize=(6, 4))
+
+    x = np.log(S_norm)
+    y = np.log(tau)
+
+    # Data points
+    ax.scatter(x, y, s=50, alpha=0.7, label='Data')
+
+    # Fit line
+    if slope is not None:
+        x_fit = np.linspace(x.min(), x.max(), 100)
+        y_fit = slope * x_fit + (y.mean() - slope * x.mean())
+        ax.plot(x_fit, y_fit, 'r-', alpha=0.8,
+                label=f'δ = {slope:.3f} ± {slope_se:.3f}')
+
+    ax.set_xlabel('log(S_norm)')
+    ax.set_ylabel('log(τ [s])')
+    ax.set_title(f'System {system_id} ({env_tag})')
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=150)
+    plt.close(fig)
+
+
+def render_histogram(path, slopes, combined):
+    """Plot δ histogram with FE/RE lines"""
+    plt = _pyplot()
+    fig, ax = plt.subplots(1, 1, figsize=(7, 5))
+
+    ax.hist(slopes, bins=15, alpha=0.7, edgecolor='black')
+
+    # Add vertical lines for combined estimates
+    ax.axvline(combined['μ_FE'], color='blue', linestyle='--',
+               label=f"FE: {combined['μ_FE']:.3f} ± {combined['se_FE']:.3f}")
+    ax.axvline(combined['μ_RE'], color='red', linestyle='-',
+               label=f"RE: {combined['μ_RE']:.3f} ± {combined['se_RE']:.3f}")
+
+    ax.set_xlabel('δ_local')
+    ax.set_ylabel('Count')
+    ax.set_title('Distribution of Local δ Values')
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=150)
+    plt.close(fig)
+
+
+def render_summary(path, combined):
+    """Create text summary figure"""
+    plt = _pyplot()
+    fig, ax = plt.subplots(1, 1, figsize=(6, 4))
+    ax.axis('off')
+
+    text = f"""
+    D1 Quantum Decoherence Analysis
+    ================================
+
+    Fixed-Effect δ:  {combined['μ_FE']:.3f} ± {combined['se_FE']:.3f}
+    Random-Effect δ: {combined['μ_RE']:.3f} ± {combined['se_RE']:.3f}
+
+    Heterogeneity:
+      Q statistic: {combined['Q']:.2f}
+      τ² between: {combined['τ2_between']:.4f}
+      k (included): {combined['k']}
+
+    Result: δ_quantum = {combined['μ_RE']:.3f} ± {combined['se_RE']:.3f}
+    """
+
+    ax.text(0.5, 0.5, text, transform=ax.transAxes,
+            fontsize=12, verticalalignment='center',
+            horizontalalignment='center', fontfamily='monospace')
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=150)
+    plt.close(fig)
+
+
+RENDERERS = {
+    'series': render_series,
+    'histogram': render_histogram,
+    'summary': render_summary,
+}
+
+
+def render_spec(spec):
+    """Render one PlotSpec to its path"""
+    RENDERERS[spec.kind](spec.path, **spec.data)
+    return str(spec.path)
+
+
+def _init_worker():
+    # Select Agg before any pyplot import in the worker
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+class RenderQueue:
+    """
+    Collects plot specs during fitting and renders them afterwards
+
+    With spill_path, flush() appends the queued specs to that file (for a
+    later --plots-only run) instead of rendering them; either way they
+    leave memory, so flushing after every streamed batch keeps only one
+    batch's window arrays alive.
+    """
+
+    def __init__(self, spill_path=None):
+        self.specs = []
+        self.spill_path = spill_path
+        self.n_flushed = 0
+        self.n_rendered = 0
+        if spill_path is not None:
+            open(spill_path, 'wb').close()
+
+    def __len__(self):
+        return self.n_flushed + len(self.specs)
+
+    def add_series(self, path, S_norm, tau, system_id, env_tag, slope, slope_se):
+        self.specs.append(PlotSpec('series', path, {
+            'S_norm': np.asarray(S_norm), 'tau': np.asarray(tau),
+            'system_id': system_id, 'env_tag': env_tag,
+            'slope': slope, 'slope_se': slope_se
+        }))
+
+    def add_histogram(self, path, slopes, combined):
+        self.specs.append(PlotSpec('histogram', path, {
+            'slopes': np.asarray(slopes), 'combined': dict(combined)
+        }))
+
+    def add_summary(self, path, combined):
+        self.specs.append(PlotSpec('summary', path, {'combined': dict(combined)}))
+
+    def flush(self, jobs=1):
+        """Spill (with spill_path) or render the queued specs and drop them"""
+        if not self.specs:
+            return
+        if self.spill_path is not None:
+            with open(self.spill_path, 'ab') as f:
+                pickle.dump(self.specs, f)
+        else:
+            self.n_rendered += self.render(jobs)
+        self.n_flushed += len(self.specs)
+        self.specs = []
+
+    def save(self, path):
+        """Pickle the queued specs so they can be rendered later (--plots-only)"""
+        with open(path, 'wb') as f:
+            pickle.dump(self.specs, f)
+
+    @classmethod
+    def iter_saved(cls, path):
+        """Queues for each block of specs in a saved or spilled spec file"""
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    specs = pickle.load(f)
+                except EOFError:
+                    return
+                queue = cls()
+                queue.specs = specs
+                yield queue
+
+    @classmethod
+    def load(cls, path):
+        queue = cls()
+        for block in cls.iter_saved(path):
+            queue.specs.extend(block.specs)
+        return queue
+
+    def render(self, jobs=1):
+        """
+        Render all queued specs, in a process pool if jobs > 1
+        Returns number of figures written
+        """
+        if not self.specs:
+            return 0
+        if not have_matplotlib():
+            print("Warning: matplotlib not available, plots will be skipped")
+            return 0
+
+        for spec in self.specs:
+            Path(spec.path).parent.mkdir(parents=True, exist_ok=True)
+
+        if jobs <= 1:
+            for spec in self.specs:
+                render_spec(spec)
+        else:
+            chunksize = max(1, len(self.specs) // (4 * jobs))
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+                list(pool.map(render_spec, self.specs, chunksize=chunksize))
+        return len(self.specs)
@@ -6,6 +6,8 @@ Implements rigorous model comparison for platform-to-scale mapping:
 - M1: θ = δ × φ (multiplicative scaling)
 - M2: θ = δ / φ (divisive efficiency) 
 - M3: θ = δ × φ^β (flexible power law)
+Models come from the registry in mapping_models.py (declared in
+platform_map.yml or registered by plugins), so new mappings need no code here.
 
 Features:
 - Physics-informed priors
@@ -15,15 +17,138 @@ Features:
 - No circularity with cosmological δ
 """
 
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pandas as pd
 import yaml
 from scipy.optimize import minimize
 from sklearn.model_selection import KFold
-from scipy.stats import norm
 import warnings
 warnings.filterwarnings('ignore')
 
+from ensemble import run_ensemble
+from mapping_models import load_models
+
+
+# Read-only arrays of the per-platform columns used by the likelihood and priors;
+# ll_const is the Gaussian normalisation -0.5 Σ log(2π se²)
+PlatformArrays = namedtuple('PlatformArrays', [
+    'theta', 'theta_se', 'phi_min', 'phi_max', 'phi_prior_mean', 'phi_prior_std', 'll_const'
+])
+
+_LOG_SQRT_2PI = 0.5 * np.log(2 * np.pi)
+
+
+def compile_platform_data(platform_data):
+    """Convert a platform_data DataFrame to PlatformArrays (compiled input passes through)"""
+    if isinstance(platform_data, PlatformArrays):
+        return platform_data
+    
+    columns = {}
+    for field, column in [('theta', 'theta_local'), ('theta_se', 'theta_se'),
+                          ('phi_min', 'phi_min'), ('phi_max', 'phi_max'),
+                          ('phi_prior_mean', 'phi_prior_mean'), ('phi_prior_std', 'phi_prior_std')]:
+        values = platform_data[column].values.astype(float)
+        values.flags.writeable = False
+        columns[field] = values
+    ll_const = -0.5 * np.sum(np.log(2 * np.pi * columns['theta_se']**2))
+    return PlatformArrays(ll_const=ll_const, **columns)
+
+
+def _norm_logpdf(x, mean, std):
+    return -0.5 * ((x - mean) / std)**2 - np.log(std) - _LOG_SQRT_2PI
+
+
+def chain_summary(chain, burn, block_steps=1000, max_quantile_samples=200000):
+    """
+    Posterior summary of chain[burn:] without loading it into memory
+
+    chain is (n_steps, n_walkers, n_dim), typically a memmap. Means and
+    standard deviations are accumulated block by block (Chan et al. pairwise
+    moments); quantiles come from the post-burn steps thinned to at most
+    max_quantile_samples draws. Returns (mean, std, thinned samples).
+    """
+    n_steps, n_walkers, n_dim = chain.shape
+    n, mean, m2 = 0, np.zeros(n_dim), np.zeros(n_dim)
+    for a in range(burn, n_steps, block_steps):
+        block = np.asarray(chain[a:a + block_steps]).reshape(-1, n_dim)
+        nb, mb = len(block), block.mean(axis=0)
+        d = mb - mean
+        mean = mean + d * nb / (n + nb)
+        m2 = m2 + ((block - mb)**2).sum(axis=0) + d**2 * n * nb / (n + nb)
+        n += nb
+    
+    thin = max(1, -(-(n_steps - burn) * n_walkers // max_quantile_samples))
+    samples = np.asarray(chain[burn::thin]).reshape(-1, n_dim)
+    if n < 2:
+        raise ValueError(f"burn={burn} leaves {n} samples of a {n_steps}-step chain")
+    return mean, np.sqrt(m2 / (n - 1)), samples
+
+
+def _fit_subproblem(mapper, data, model_name, initial):
+    """Fit one model to compiled platform arrays (top-level for worker processes)"""
+    return mapper.fit_model(data, model_name, initial=initial)
+
+
+class RefitScheduler:
+    """
+    Schedules model refits on subsets of the platforms
+    
+    Each refit is keyed by (model, kept platform indices) and cached, so
+    subproblems shared between CV folds and the jackknife are fitted once.
+    Each platform subset is compiled to arrays once and shared by all models.
+    Refits warm-start from the model's full-data MAP with the dropped φ
+    removed, and a batch of uncached refits runs in a process pool when
+    jobs > 1.
+    """
+    
+    def __init__(self, mapper, platform_data, jobs=1):
+        self.mapper = mapper
+        self.platform_data = platform_data
+        self.jobs = jobs
+        self.all = tuple(range(len(platform_data)))
+        self.cache = {}
+        self.subsets = {}
+        self.n_fits = 0
+    
+    def subset(self, keep):
+        """Compiled PlatformArrays for the kept platforms"""
+        if keep not in self.subsets:
+            self.subsets[keep] = compile_platform_data(self.platform_data.iloc[list(keep)])
+        return self.subsets[keep]
+    
+    def warm_start(self, model_name, keep):
+        """Full-data MAP restricted to the kept platforms, or None"""
+        full = self.cache.get((model_name, self.all))
+        if full is None or not full['success']:
+            return None
+        params = np.asarray(full['params'])
+        n_global = len(params) - len(self.all)  # φ block comes last
+        return np.concatenate([params[:n_global], params[n_global:][list(keep)]])
+    
+    def fit(self, requests):
+        """
+        Fit (model_name, keep) pairs; returns results in request order
+        Request full-data fits (keep = all platforms) first so that subset
+        fits can warm-start from them.
+        """
+        requests = [(model_name, tuple(keep)) for model_name, keep in requests]
+        todo = list(dict.fromkeys(r for r in requests if r not in self.cache))
+        tasks = [(self.mapper, self.subset(keep), model_name,
+                  self.warm_start(model_name, keep)) for model_name, keep in todo]
+        
+        if self.jobs <= 1 or len(tasks) <= 1:
+            results = [_fit_subproblem(*task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+                results = list(pool.map(_fit_subproblem, *zip(*tasks)))
+        
+        self.n_fits += len(tasks)
+        self.cache.update(zip(todo, results))
+        return [self.cache[r] for r in requests]
+
 
 class EnhancedPlatformMapper:
     def __init__(self, config_path):
@@ -32,7 +157,7 @@ class EnhancedPlatformMapper:
             self.config = yaml.safe_load(f)
         
         self.platforms = self.config['platforms']
-        self.models = self.config['model_selection']['models']
+        self.models = load_models(self.config['model_selection'])
         self.meta_config = self.config['meta_regression']
         
     def extract_platform_data(self, results_df):
@@ -65,111 +190,72 @@ class EnhancedPlatformMapper:
         
         return pd.DataFrame(platform_data)
     
-    def model_M1_multiplicative(self, params, platform_data):
-        """Model M1: θ = δ × φ"""
-        delta = params[0]
-        phi_values = params[1:1+len(platform_data)]
-        
-        theta_pred = delta * phi_values
-        return theta_pred
-    
-    def model_M2_divisive(self, params, platform_data):
-        """Model M2: θ = δ / φ"""
-        delta = params[0]  
-        phi_values = params[1:1+len(platform_data)]
-        
-        theta_pred = delta / phi_values
-        return theta_pred
-    
-    def model_M3_power(self, params, platform_data):
-        """Model M3: θ = δ × φ^β"""
-        delta = params[0]
-        beta = params[1]
-        phi_values = params[2:2+len(platform_data)]
-        
-        theta_pred = delta * (phi_values ** beta)
-        return theta_pred
+    # Densities take params of shape (n_params,) or (n_candidates, n_params)
+    # and evaluate every candidate at once; model_func is a registry model's
+    # predict(params, n_platforms).
     
     def log_likelihood(self, params, platform_data, model_func):
         """Compute log-likelihood for a given model"""
+        data = compile_platform_data(platform_data)
         try:
-            theta_pred = model_func(params, platform_data)
-            theta_obs = platform_data['theta_local'].values
-            theta_se = platform_data['theta_se'].values
+            theta_pred = model_func(params, len(data.theta))
             
             # Gaussian likelihood
-            ll = -0.5 * np.sum(((theta_obs - theta_pred) / theta_se)**2)
-            ll -= 0.5 * np.sum(np.log(2 * np.pi * theta_se**2))
+            ll = -0.5 * np.sum(((data.theta - theta_pred) / data.theta_se)**2, axis=-1)
+            ll += data.ll_const
             
-            return ll
+            return ll[()]
         except:
             return -1e6
     
     def log_prior(self, params, platform_data, model_name):
         """Compute log-prior for model parameters"""
-        lp = 0.0
-        
-        # Universal δ prior (uninformative)
-        delta = params[0]
-        if not (0.1 < delta < 3.0):
-            return -np.inf
+        data = compile_platform_data(platform_data)
+        params = np.asarray(params, dtype=float)
+        model = self.models[model_name]
         
-        if model_name == 'M3_power':
-            # Beta parameter prior
-            beta = params[1]
-            if not (0.1 < beta < 3.0):
-                return -np.inf
-            lp += norm.logpdf(beta, 1.0, 0.5)  # Weak prior around 1
-            phi_start_idx = 2
-        else:
-            phi_start_idx = 1
+        # Global parameters: strict bounds, flat or Gaussian priors
+        lp, inside = model.log_prior_globals(params)
+        phi_start_idx = model.n_global
         
         # Platform-specific φ priors
-        phi_values = params[phi_start_idx:phi_start_idx+len(platform_data)]
+        phi_values = params[..., phi_start_idx:phi_start_idx+len(data.theta)]
+        m = phi_values.shape[-1]
+        inside &= np.all((data.phi_min[:m] <= phi_values) & (phi_values <= data.phi_max[:m]), axis=-1)
         
-        for i, (phi, row) in enumerate(zip(phi_values, platform_data.itertuples())):
-            if not (row.phi_min <= phi <= row.phi_max):
-                return -np.inf
-            
-            # Physics-informed prior
-            lp += norm.logpdf(phi, row.phi_prior_mean, row.phi_prior_std)
+        # Physics-informed prior
+        lp = lp + np.sum(_norm_logpdf(phi_values, data.phi_prior_mean[:m], data.phi_prior_std[:m]), axis=-1)
         
-        return lp
+        return np.where(inside, lp, -np.inf)[()]
     
     def log_posterior(self, params, platform_data, model_func, model_name):
         """Compute log-posterior"""
-        lp = self.log_prior(params, platform_data, model_name)
-        if not np.isfinite(lp):
+        data = compile_platform_data(platform_data)
+        lp = self.log_prior(params, data, model_name)
+        if np.ndim(lp) == 0 and not np.isfinite(lp):
             return -np.inf
         
-        ll = self.log_likelihood(params, platform_data, model_func)
-        return lp + ll
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            ll = self.log_likelihood(params, data, model_func)
+        return np.where(np.isfinite(lp), lp + ll, -np.inf)[()]
     
-    def fit_model(self, platform_data, model_name):
-        """Fit a specific model using MAP estimation"""
-        model_info = self.models[model_name]
-        
-        if model_name == 'M1_multiplicative':
-            model_func = self.model_M1_multiplicative
-            n_phi = len(platform_data)
-            initial = [0.5] + platform_data['phi_prior_mean'].tolist()
-            bounds = [(0.1, 3.0)] + [(row.phi_min, row.phi_max) for row in platform_data.itertuples()]
-            
-        elif model_name == 'M2_divisive':
-            model_func = self.model_M2_divisive
-            n_phi = len(platform_data)
-            initial = [1.5] + platform_data['phi_prior_mean'].tolist()  # Higher δ for divisive
-            bounds = [(0.1, 3.0)] + [(row.phi_min, row.phi_max) for row in platform_data.itertuples()]
-            
-        elif model_name == 'M3_power':
-            model_func = self.model_M3_power
-            n_phi = len(platform_data)
-            initial = [0.5, 1.0] + platform_data['phi_prior_mean'].tolist()
-            bounds = [(0.1, 3.0), (0.1, 3.0)] + [(row.phi_min, row.phi_max) for row in platform_data.itertuples()]
+    def fit_model(self, platform_data, model_name, initial=None):
+        """
+        Fit a specific model using MAP estimation
+        initial overrides the default starting point (e.g. a warm start)
+        """
+        model = self.models[model_name]
+        model_func = model.predict
+        data = compile_platform_data(platform_data)
+        
+        if initial is None:
+            initial = model.initial + data.phi_prior_mean.tolist()
+        initial = list(initial)
+        bounds = model.bounds + list(zip(data.phi_min, data.phi_max))
         
         # Optimize
         result = minimize(
-            fun=lambda params: -self.log_posterior(params, platform_data, model_func, model_name),
+            fun=lambda params: -self.log_posterior(params, data, model_func, model_name),
             x0=initial,
             bounds=bounds,
             method='L-BFGS-B'
@@ -177,9 +263,9 @@ class EnhancedPlatformMapper:
         
         if result.success:
             # Compute model metrics
-            ll = self.log_likelihood(result.x, platform_data, model_func)
+            ll = self.log_likelihood(result.x, data, model_func)
             n_params = len(result.x)
-            n_data = len(platform_data)
+            n_data = len(data.theta)
             
             aic = 2 * n_params - 2 * ll
             bic = np.log(n_data) * n_params - 2 * ll
@@ -191,36 +277,123 @@ class EnhancedPlatformMapper:
                 'aic': aic,
                 'bic': bic,
                 'n_params': n_params,
-                'model_func': model_func
+                'model_func': model_func,
+                'bounds': bounds
             }
         else:
             return {'success': False, 'message': result.message}
     
-    def cross_validate_model(self, platform_data, model_name):
-        """Cross-validate a specific model"""
-        if len(platform_data) < self.meta_config['cross_validation']['folds']:
-            return None
+    def param_names(self, model_name, platform_data):
+        """Parameter labels in model order: global parameters, then one φ per platform"""
+        return self.models[model_name].global_names + [f'phi_{p}' for p in platform_data['platform']]
+    
+    def initial_walkers(self, log_prob, center, bounds, n_walkers, rng, scale=1e-2, max_tries=100):
+        """Gaussian ball around center, inside bounds and with finite log_prob"""
+        center = np.asarray(center, dtype=float)
+        lo, hi = np.array(bounds, dtype=float).T
+        walkers = np.tile(center, (n_walkers, 1))
+        todo = np.arange(n_walkers)
+        for _ in range(max_tries):
+            if len(todo) == 0:
+                break
+            trial = center + scale * (hi - lo) * rng.standard_normal((len(todo), len(center)))
+            trial = np.clip(trial, lo, hi)
+            ok = np.isfinite(log_prob(trial))
+            walkers[todo[ok]] = trial[ok]
+            todo = todo[~ok]
+        return walkers
+    
+    def sample_model(self, platform_data, model_name, n_walkers=32, n_steps=2000,
+                     chain_path=None, seed=None, burn=None, resume=True, checkpoint_every=100):
+        """
+        Sample the posterior of a mapping model with the ensemble sampler
+        
+        Walkers start in a small ball around the MAP fit and all of them
+        are evaluated per half-step in one vectorized log_posterior call.
+        With chain_path the chain is a memory-mapped .npy file that is
+        checkpointed and resumed. The first burn steps (default half) are
+        dropped from the summary, which is computed block by block over the
+        chain; 'samples' is the thinned post-burn slice used for quantiles.
+        """
+        fit = self.fit_model(platform_data, model_name)
+        if not fit['success']:
+            return {'success': False, 'message': fit['message']}
+        
+        data = compile_platform_data(platform_data)
+        model_func = fit['model_func']
+        log_prob = lambda params: self.log_posterior(params, data, model_func, model_name)
+        
+        rng = np.random.default_rng(seed)
+        initial = self.initial_walkers(log_prob, fit['params'], fit['bounds'], n_walkers, rng)
+        chain, lp, acceptance = run_ensemble(
+            log_prob, initial, n_steps, chain_path=chain_path,
+            seed=None if seed is None else seed + 1,
+            checkpoint_every=checkpoint_every, resume=resume
+        )
         
+        burn = n_steps // 2 if burn is None else burn
+        mean, std, samples = chain_summary(chain, burn)
+        q16, q50, q84 = np.percentile(samples, [16, 50, 84], axis=0)
+        summary = pd.DataFrame({
+            'param': self.param_names(model_name, platform_data),
+            'mean': mean,
+            'std': std,
+            'q16': q16, 'q50': q50, 'q84': q84
+        })
+        
+        return {
+            'success': True,
+            'map_fit': fit,
+            'chain': chain,
+            'log_prob': lp,
+            'acceptance_fraction': acceptance,
+            'samples': samples,
+            'summary': summary
+        }
+    
+    def cv_splits(self, n_platforms):
+        """Training-set indices of each CV fold"""
         cv = KFold(
             n_splits=self.meta_config['cross_validation']['folds'],
             shuffle=True,
             random_state=self.meta_config['cross_validation']['seed']
         )
+        return [(tuple(train_idx), val_idx) for train_idx, val_idx in cv.split(np.arange(n_platforms))]
+    
+    def refit_requests(self, platform_data, model_names, jackknife_model=None):
+        """(model, kept platforms) subproblems for CV and, optionally, the jackknife"""
+        n = len(platform_data)
+        requests = []
+        if n >= self.meta_config['cross_validation']['folds']:
+            for train_idx, _ in self.cv_splits(n):
+                requests.extend((model_name, train_idx) for model_name in model_names)
+        if jackknife_model is not None:
+            requests.extend((jackknife_model, tuple(j for j in range(n) if j != i))
+                            for i in range(n))
+        return requests
+    
+    def cross_validate_model(self, platform_data, model_name, scheduler=None):
+        """Cross-validate a specific model"""
+        if len(platform_data) < self.meta_config['cross_validation']['folds']:
+            return None
+        
+        if scheduler is None:
+            scheduler = RefitScheduler(self, platform_data)
+        scheduler.fit([(model_name, scheduler.all)])
+        
+        splits = self.cv_splits(len(platform_data))
+        train_results = scheduler.fit([(model_name, train_idx) for train_idx, _ in splits])
         
         cv_scores = []
         
-        for train_idx, val_idx in cv.split(platform_data):
-            train_data = platform_data.iloc[train_idx].reset_index(drop=True)
+        for (_, val_idx), train_result in zip(splits, train_results):
             val_data = platform_data.iloc[val_idx].reset_index(drop=True)
             
-            # Fit on training data
-            train_result = self.fit_model(train_data, model_name)
-            
             if train_result['success']:
-                # Evaluate on validation data
+                # Evaluate on validation data (globals + leading φ block, as before)
+                n_global = self.models[model_name].n_global
                 val_ll = self.log_likelihood(
-                    train_result['params'][:1+len(val_data)] if model_name != 'M3_power' 
-                    else train_result['params'][:2+len(val_data)],
+                    train_result['params'][:n_global+len(val_data)],
                     val_data, 
                     train_result['model_func']
                 )
@@ -230,17 +403,21 @@ class EnhancedPlatformMapper:
         
         return np.mean(cv_scores) if cv_scores else None
     
-    def jackknife_analysis(self, platform_data, best_model_name, best_params):
+    def jackknife_analysis(self, platform_data, best_model_name, best_params, scheduler=None):
         """Jackknife robustness analysis"""
+        if scheduler is None:
+            scheduler = RefitScheduler(self, platform_data)
+        scheduler.fit([(best_model_name, scheduler.all)])
+        
+        # Refit model with each platform removed
+        n = len(platform_data)
+        jack_results = scheduler.fit([
+            (best_model_name, tuple(j for j in range(n) if j != i)) for i in range(n)
+        ])
+        
         jackknife_results = []
         
-        for i in range(len(platform_data)):
-            # Remove one platform
-            jack_data = platform_data.drop(i).reset_index(drop=True)
-            
-            # Refit model
-            jack_result = self.fit_model(jack_data, best_model_name)
-            
+        for i, jack_result in enumerate(jack_results):
             if jack_result['success']:
                 delta_jack = jack_result['params'][0]
                 jackknife_results.append({
@@ -259,6 +436,10 @@ class EnhancedPlatformMapper:
         platform_data = self.extract_platform_data(results_df)
         print(f"Validated {len(platform_data)} platforms for mapping")
         
+        return self.compare_models(platform_data)
+    
+    def compare_models(self, platform_data):
+        """Model comparison, CV and jackknife on already-extracted platform data"""
         if len(platform_data) < 3:
             print("Need at least 3 platforms for model comparison")
             return None, None, None
@@ -269,19 +450,27 @@ class EnhancedPlatformMapper:
             print(f"  {row['platform']}: θ = {row['theta_local']:.3f} ± {row['theta_se']:.3f} "
                   f"[range: {row['log_range_x']:.1f} decades]")
         
-        # Model comparison
-        print(f"\n--- Model Comparison ---")
+        # Full-data fits, then the whole (model × fold) + jackknife grid at once
+        scheduler = RefitScheduler(self, platform_data, jobs=self.meta_config.get('jobs', 1))
+        model_names = list(self.models.keys())
+        full_fits = dict(zip(model_names, scheduler.fit([(m, scheduler.all) for m in model_names])))
+        fitted = [m for m in model_names if full_fits[m]['success']]
+        if fitted:
+            bic_best = min(fitted, key=lambda m: full_fits[m]['bic'])
+            scheduler.fit(self.refit_requests(platform_data, fitted, jackknife_model=bic_best))
+        
+        # Model comparison (all fits above are done; this only reports them)
+        print(f"\n--- Model Comparison ({len(fitted)}/{len(model_names)} models fitted) ---")
         model_results = {}
         
-        for model_name in self.models.keys():
-            print(f"\nFitting {model_name}...")
+        for model_name in model_names:
+            print(f"\n{model_name}:")
             
-            # Fit model
-            fit_result = self.fit_model(platform_data, model_name)
+            fit_result = dict(full_fits[model_name])
             
             if fit_result['success']:
                 # Cross-validation
-                cv_score = self.cross_validate_model(platform_data, model_name)
+                cv_score = self.cross_validate_model(platform_data, model_name, scheduler)
                 
                 fit_result['cv_score'] = cv_score
                 model_results[model_name] = fit_result
@@ -308,7 +497,8 @@ class EnhancedPlatformMapper:
         
         # Jackknife analysis
         print(f"\n--- Robustness Analysis ---")
-        jackknife_df = self.jackknife_analysis(platform_data, best_model, best_result['params'])
+        jackknife_df = self.jackknife_analysis(platform_data, best_model, best_result['params'], scheduler)
+        print(f"Refits: {scheduler.n_fits} distinct subproblems fitted")
         
         if not jackknife_df.empty:
             max_delta_shift = jackknife_df['delta_difference'].abs().max()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+ensemble.py - Vectorized affine-invariant ensemble sampler
+
+Goodman & Weare stretch move with the red/blue split: each half of the
+ensemble is proposed and evaluated in a single call to a vectorized
+log-density mapping (n, n_dim) -> (n,). Chains can be written to
+memory-mapped .npy files with a small JSON checkpoint, so long runs keep RAM
+flat and an interrupted run resumes from its last checkpoint.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+
+def stretch_step(log_prob, walkers, lp, rng, a=2.0):
+    """
+    One stretch-move update of every walker, in place
+    Returns boolean array of accepted moves per walker
+    """
+    n, n_dim = walkers.shape
+    half = n // 2
+    accepted = np.zeros(n, dtype=bool)
+
+    for active, other in ((slice(0, half), slice(half, n)), (slice(half, n), slice(0, half))):
+        x, partners = walkers[active], walkers[other]
+        m = len(x)
+        z = ((a - 1) * rng.random(m) + 1) ** 2 / a
+        partners = partners[rng.integers(0, len(partners), m)]
+        proposal = partners + z[:, None] * (x - partners)
+
+        lp_new = log_prob(proposal)
+        log_ratio = (n_dim - 1) * np.log(z) + lp_new - lp[active]
+        # NaN log-densities compare False and are rejected
+        accept = np.log(rng.random(m)) < log_ratio
+
+        x[accept] = proposal[accept]
+        lp[active][accept] = lp_new[accept]
+        accepted[active] = accept
+
+    return accepted
+
+
+class ChainStore:
+    """
+    Memory-mapped chain (n_steps, n_walkers, n_dim) plus log-probabilities
+
+    Files: <path> (chain), <stem>_logprob.npy and <stem>.json holding the
+    number of completed steps, acceptance counts and the RNG state.
+    """
+
+    def __init__(self, path, n_steps, n_walkers, n_dim, resume=True):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lp_path = self.path.with_name(self.path.stem + '_logprob.npy')
+        self.state_path = self.path.with_suffix('.json')
+        shape = (n_steps, n_walkers, n_dim)
+
+        self.state = None
+        if resume and self.state_path.exists():
+            with open(self.state_path) as f:
+                state = json.load(f)
+            if tuple(state['shape']) != shape:
+                raise ValueError(f"Checkpoint {self.state_path} has shape {tuple(state['shape'])}, "
+                                 f"requested {shape}; use resume=False to start over")
+            self.chain = open_memmap(self.path, mode='r+')
+            self.log_prob = open_memmap(self.lp_path, mode='r+')
+            self.state = state
+        else:
+            self.chain = open_memmap(self.path, mode='w+', dtype=float, shape=shape)
+            self.log_prob = open_memmap(self.lp_path, mode='w+', dtype=float, shape=shape[:2])
+
+    @property
+    def n_done(self):
+        return self.state['n_done'] if self.state else 0
+
+    def checkpoint(self, n_done, n_accept, rng):
+        """Flush chain data, then atomically record progress"""
+        self.chain.flush()
+        self.log_prob.flush()
+        self.state = {
+            'shape': list(self.chain.shape),
+            'n_done': int(n_done),
+            'n_accept': [int(c) for c in n_accept],
+            'rng_state': rng.bit_generator.state,
+        }
+        tmp = self.state_path.with_suffix('.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.state_path)
+
+
+def run_ensemble(log_prob, initial, n_steps, chain_path=None, seed=None,
+                 checkpoint_every=100, resume=True, a=2.0):
+    """
+    Sample with the stretch move from initial walkers (n_walkers, n_dim)
+
+    With chain_path the chain lives in a memory-mapped .npy file and is
+    checkpointed every checkpoint_every steps; an existing checkpoint of the
+    same shape is resumed (walkers, log-probs and RNG state restored).
+    Returns (chain, log_prob, acceptance_fraction).
+    """
+    initial = np.array(initial, dtype=float)
+    n_walkers, n_dim = initial.shape
+    if n_walkers < 2 * n_dim or n_walkers % 2:
+        raise ValueError(f"Need an even number of walkers >= 2 * n_dim ({2 * n_dim}), got {n_walkers}")
+
+    rng = np.random.default_rng(seed)
+    store = None
+    if chain_path is not None:
+        store = ChainStore(chain_path, n_steps, n_walkers, n_dim, resume=resume)
+        chain, lp_chain = store.chain, store.log_prob
+    else:
+        chain = np.empty((n_steps, n_walkers, n_dim))
+        lp_chain = np.empty((n_steps, n_walkers))
+
+    start = store.n_done if store is not None else 0
+    if start > 0:
+        walkers = np.array(chain[start - 1])
+        lp = np.array(lp_chain[start - 1])
+        n_accept = np.array(store.state['n_accept'])
+        rng.bit_generator.state = store.state['rng_state']
+        print(f"Resuming from step {start}/{n_steps} ({chain_path})")
+    else:
+        walkers = initial
+        lp = np.asarray(log_prob(walkers), dtype=float)
+        n_accept = np.zeros(n_walkers, dtype=int)
+        if not np.all(np.isfinite(lp)):
+            raise ValueError("All initial walkers must have finite log-probability")
+
+    for step in range(start, n_steps):
+        n_accept += stretch_step(log_prob, walkers, lp, rng, a)
+        chain[step] = walkers
+        lp_chain[step] = lp
+        if store is not None and ((step + 1) % checkpoint_every == 0 or step + 1 == n_steps):
+            store.checkpoint(step + 1, n_accept, rng)
+
+    return chain, lp_chain, n_accept / max(n_steps, 1)
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+"""
+evidence.py - Thermodynamic-integration evidence for model selection
+
+Marginal likelihoods from parallel-tempered ensemble chains:
+
+    log Z = ∫₀¹ E_β[log L] dβ,   sampling ∝ π(θ) L(θ)^β
+
+All temperatures advance together: one stretch move per temperature and
+half-ensemble is a single vectorized call over (n_temps × n_walkers/2)
+parameter vectors, followed by swaps between neighbouring temperatures.
+Because TI integrates from the prior (β = 0), unnormalised priors such as
+the truncated Gaussians on φ need no normalising constant.
+
+Monte-Carlo errors come from independent replicate runs (different seeds),
+which are spread over worker processes together with the models. Compares
+the EnhancedPlatformMapper models (M1/M2/M3) and the single- vs
+domain-specific-δ models on the per-domain δ table, and writes Bayes factors
+with their MC errors.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from d1_io import read_table, write_table
+from enhanced_mapper import EnhancedPlatformMapper, compile_platform_data
+from hierarchical import domain_rows
+
+_trapezoid = getattr(np, 'trapezoid', None) or np.trapz
+
+# Defaults for model_selection.evidence in platform_map.yml
+EVIDENCE_DEFAULTS = {
+    'n_temps': 16,
+    'ladder_power': 5,
+    'n_walkers': 32,
+    'n_steps': 2000,
+    'burn_fraction': 0.5,
+    'n_replicates': 4,
+    'jobs': 1,
+    'seed': 42,
+}
+
+
+def temperature_ladder(n_temps, power=5):
+    """β_t = (t / (T-1))^power: dense near β = 0 where E_β[log L] changes fastest"""
+    return np.linspace(0, 1, n_temps) ** power
+
+
+def _evaluate(func, params):
+    """Vectorized log-density on (n, D) params as a float array of length n"""
+    return np.broadcast_to(np.asarray(func(params), dtype=float), params.shape[:1])
+
+
+def pt_step(log_prior, log_like, walkers, lp, ll, betas, rng, a=2.0):
+    """
+    One parallel-tempering update, in place
+
+    walkers: (T, W, D); lp, ll: (T, W). Stretch moves pair walkers within a
+    temperature; then each neighbouring pair of temperatures proposes W
+    swaps. Returns (accepted moves (T, W), accepted swaps (T-1,)).
+    """
+    T, W, D = walkers.shape
+    half = W // 2
+    accepted = np.zeros((T, W), dtype=bool)
+
+    for active, other in ((slice(0, half), slice(half, W)), (slice(half, W), slice(0, half))):
+        x, pool = walkers[:, active], walkers[:, other]
+        m = x.shape[1]
+        z = ((a - 1) * rng.random((T, m)) + 1) ** 2 / a
+        partners = np.take_along_axis(pool, rng.integers(0, pool.shape[1], (T, m))[..., None], axis=1)
+        proposal = partners + z[..., None] * (x - partners)
+
+        flat = proposal.reshape(-1, D)
+        lp_new = _evaluate(log_prior, flat).reshape(T, m)
+        with np.errstate(invalid='ignore', over='ignore', divide='ignore'):
+            ll_new = np.where(np.isfinite(lp_new), _evaluate(log_like, flat).reshape(T, m), -np.inf)
+            log_ratio = ((D - 1) * np.log(z) + lp_new + betas[:, None] * ll_new
+                         - lp[:, active] - betas[:, None] * ll[:, active])
+        accept = np.isfinite(lp_new) & (np.log(rng.random((T, m))) < log_ratio)
+
+        x[accept] = proposal[accept]
+        lp[:, active][accept] = lp_new[accept]
+        ll[:, active][accept] = ll_new[accept]
+        accepted[:, active] = accept
+
+    # Even pairs (0,1), (2,3), ... then odd pairs, each as one vectorized swap
+    swaps = np.zeros(T - 1)
+    for first in (0, 1):
+        t = np.arange(first, T - 1, 2)
+        if len(t) == 0:
+            continue
+        perm = np.argsort(rng.random((len(t), W)), axis=1)
+        hot_ll = np.take_along_axis(ll[t], perm, axis=1)
+        log_swap = (betas[t + 1] - betas[t])[:, None] * (hot_ll - ll[t + 1])
+        swap = np.log(rng.random((len(t), W))) < log_swap
+        
+        rows, cold = np.nonzero(swap)
+        hot = perm[rows, cold]
+        for arr in (walkers, lp, ll):
+            arr[t[rows] + 1, cold], arr[t[rows], hot] = arr[t[rows], hot], arr[t[rows] + 1, cold]
+        swaps[t] = swap.mean(axis=1)
+
+    return accepted, swaps
+
+
+def ti_integrate(betas, mean_ll, var_ll=None):
+    """
+    ∫ E_β[log L] dβ by the trapezoid rule
+    With var_ll = Var_β[log L] (the slope of E_β[log L]) the rule gets the
+    Friel et al. (2014) end-point correction -Σ Δβ²/12 (V_{i+1} - V_i),
+    which removes most of the discretisation bias of a coarse ladder.
+    """
+    log_z = _trapezoid(mean_ll, betas)
+    if var_ll is not None:
+        log_z -= np.sum(np.diff(betas) ** 2 / 12 * np.diff(var_ll))
+    return log_z
+
+
+def ti_log_evidence(log_prior, log_like, initial, betas, n_steps, burn_fraction=0.5, seed=None):
+    """
+    Thermodynamic-integration estimate of log Z from one tempered run
+
+    initial: (W, D) walkers with finite prior, copied to every temperature.
+    Returns dict with log_evidence, mean log L per β, and acceptance/swap rates.
+    """
+    betas = np.asarray(betas, dtype=float)
+    rng = np.random.default_rng(seed)
+    walkers = np.repeat(np.asarray(initial, dtype=float)[None], len(betas), axis=0)
+    T, W, D = walkers.shape
+    lp = np.array(_evaluate(log_prior, walkers.reshape(-1, D))).reshape(T, W)
+    ll = np.array(_evaluate(log_like, walkers.reshape(-1, D))).reshape(T, W)
+    if not np.all(np.isfinite(lp)):
+        raise ValueError("All initial walkers must have finite log-prior")
+
+    burn = int(burn_fraction * n_steps)
+    ll_sum = np.zeros(T)
+    ll_sq = np.zeros(T)
+    n_accept = np.zeros(T)
+    n_swap = np.zeros(T - 1)
+    for step in range(n_steps):
+        accepted, swaps = pt_step(log_prior, log_like, walkers, lp, ll, betas, rng)
+        n_accept += accepted.mean(axis=1)
+        n_swap += swaps
+        if step >= burn:
+            ll_sum += ll.mean(axis=1)
+            ll_sq += (ll ** 2).mean(axis=1)
+
+    mean_ll = ll_sum / (n_steps - burn)
+    var_ll = np.maximum(ll_sq / (n_steps - burn) - mean_ll ** 2, 0)
+    return {
+        'log_evidence': ti_integrate(betas, mean_ll, var_ll),
+        'mean_log_like': mean_ll,
+        'var_log_like': var_ll,
+        'acceptance': n_accept / n_steps,
+        'swap_rate': n_swap / n_steps,
+    }
+
+
+def _mapper_task(mapper, platform_data, model_name, settings, seed):
+    """Evidence replicate for one EnhancedPlatformMapper model (worker process)"""
+    fit = mapper.fit_model(platform_data, model_name)
+    if not fit['success']:
+        return np.nan
+    data = compile_platform_data(platform_data)
+    log_prior = lambda params: mapper.log_prior(params, data, model_name)
+    log_like = lambda params: mapper.log_likelihood(params, data, fit['model_func'])
+
+    rng = np.random.default_rng(seed)
+    initial = mapper.initial_walkers(log_prior, fit['params'], fit['bounds'],
+                                     settings['n_walkers'], rng, scale=0.1)
+    betas = temperature_ladder(settings['n_temps'], settings['ladder_power'])
+    return ti_log_evidence(log_prior, log_like, initial, betas, settings['n_steps'],
+                           settings['burn_fraction'], seed + 1)['log_evidence']
+
+
+def domain_models(delta, se, bounds=(0.1, 3.0)):
+    """
+    Single universal δ vs one δ per domain, uniform priors on bounds
+    Returns dict name -> (log_prior, log_like, n_params)
+    """
+    delta = np.asarray(delta, dtype=float)
+    se = np.asarray(se, dtype=float)
+    lo, hi = bounds
+    const = -0.5 * np.sum(np.log(2 * np.pi * se ** 2))
+
+    def log_prior(params):
+        inside = np.all((params > lo) & (params < hi), axis=-1)
+        return np.where(inside, -params.shape[-1] * np.log(hi - lo), -np.inf)
+
+    def log_like(params):
+        # (n, 1) broadcasts one δ over domains; (n, k) gives each its own
+        return const - 0.5 * np.sum(((delta - params) / se) ** 2, axis=-1)
+
+    return {
+        'single_delta_universal': (log_prior, log_like, 1),
+        'domain_specific_deltas': (log_prior, log_like, len(delta)),
+    }
+
+
+def _domain_task(delta, se, bounds, model_name, settings, seed):
+    """Evidence replicate for one domain-δ model (worker process)"""
+    log_prior, log_like, n_params = domain_models(delta, se, bounds)[model_name]
+    rng = np.random.default_rng(seed)
+    initial = rng.uniform(bounds[0], bounds[1], (settings['n_walkers'], n_params))
+    betas = temperature_ladder(settings['n_temps'], settings['ladder_power'])
+    return ti_log_evidence(log_prior, log_like, initial, betas, settings['n_steps'],
+                           settings['burn_fraction'], seed + 1)['log_evidence']
+
+
+def run_replicates(tasks, settings):
+    """
+    Run (comparison, model, n_params, func, args) tasks n_replicates times each
+    Seeds differ per replicate; tasks run in a process pool when jobs > 1.
+    Returns DataFrame of log-evidences with MC errors and Bayes factors.
+    """
+    R = settings['n_replicates']
+    jobs = [(func, args + (settings, settings['seed'] + 1000 * i + 2 * r))
+            for i, (_, _, _, func, args) in enumerate(tasks) for r in range(R)]
+
+    if settings['jobs'] <= 1:
+        values = [func(*args) for func, args in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=settings['jobs']) as pool:
+            futures = [pool.submit(func, *args) for func, args in jobs]
+            values = [f.result() for f in futures]
+    values = np.array(values).reshape(len(tasks), R)
+
+    rows = []
+    for (comparison, model, n_params, _, _), reps in zip(tasks, values):
+        rows.append({
+            'comparison': comparison,
+            'model': model,
+            'n_params': n_params,
+            'log_evidence': np.mean(reps),
+            'log_evidence_err': np.std(reps, ddof=1) / np.sqrt(R) if R > 1 else np.nan,
+        })
+    return bayes_factors(pd.DataFrame(rows))
+
+
+def bayes_factors(table):
+    """log BF of each model against the best model of its comparison, errors in quadrature"""
+    table = table.copy()
+    best = table.groupby('comparison')['log_evidence'].transform('max')
+    best_err = table.loc[table.groupby('comparison')['log_evidence'].idxmax()] \
+        .set_index('comparison')['log_evidence_err']
+    table['log_bayes_factor'] = table['log_evidence'] - best
+    table['log_bayes_factor_err'] = np.sqrt(table['log_evidence_err'] ** 2
+                                            + table['comparison'].map(best_err) ** 2)
+    # The best model's own factor is exactly zero
+    table.loc[table['log_bayes_factor'] == 0, 'log_bayes_factor_err'] = 0.0
+    table['bayes_factor_vs_best'] = np.exp(table['log_bayes_factor'])
+    return table
+
+
+def evidence_settings(config, **overrides):
+    """model_selection.evidence from platform_map.yml over the defaults"""
+    settings = dict(EVIDENCE_DEFAULTS)
+    settings.update(config.get('model_selection', {}).get('evidence', {}) or {})
+    settings.update({k: v for k, v in overrides.items() if v is not None})
+    return settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bayesian evidence for mapping and domain-δ models')
+    parser.add_argument('--platform_map', default='analysis/platform_map.yml',
+                        help='Mapping configuration (models, priors, evidence settings)')
+    parser.add_argument('--slopes', default='artifacts/csv/d1_per_experiment_slopes.csv',
+                        help='Per-experiment slopes from fit_d1.py')
+    parser.add_argument('--domains', default='artifacts/csv/hierarchical_delta_results.csv',
+                        help='Per-domain δ table for the single vs domain-specific comparison')
+    parser.add_argument('--out', default='artifacts/csv/evidence_compare.csv',
+                        help='Output table (CSV/Parquet/NPZ by suffix)')
+    parser.add_argument('--n_temps', type=int, help='Temperatures in the β ladder')
+    parser.add_argument('--n_steps', type=int, help='Steps per tempered run')
+    parser.add_argument('--n_replicates', type=int, help='Independent runs per model (MC error)')
+    parser.add_argument('--jobs', type=int, help='Worker processes')
+    args = parser.parse_args()
+
+    mapper = EnhancedPlatformMapper(args.platform_map)
+    settings = evidence_settings(mapper.config, n_temps=args.n_temps, n_steps=args.n_steps,
+                                 n_replicates=args.n_replicates, jobs=args.jobs)
+    tasks = []
+
+    # Mapping models M1/M2/M3
+    if Path(args.slopes).exists():
+        platform_data = mapper.extract_platform_data(read_table(args.slopes))
+        if len(platform_data) >= 2:
+            for model_name in mapper.models:
+                n_params = len(mapper.param_names(model_name, platform_data))
+                tasks.append(('mapping_model', model_name, n_params, _mapper_task,
+                              (mapper, platform_data, model_name)))
+        else:
+            print(f"Too few mappable platforms in {args.slopes}; skipping mapping models")
+
+    # Single vs domain-specific δ
+    if Path(args.domains).exists():
+        domains = read_table(args.domains)
+        domains = domain_rows(domains)
+        delta = domains['delta_estimate'].astype(float).values
+        se = domains['delta_se'].astype(float).values
+        for model_name, (_, _, n_params) in domain_models(delta, se).items():
+            tasks.append(('domain_delta', model_name, n_params, _domain_task,
+                          (delta, se, (0.1, 3.0), model_name)))
+
+    if not tasks:
+        print("No inputs found; nothing to compare")
+        return
+
+    print(f"Computing evidence for {len(tasks)} models × {settings['n_replicates']} replicates "
+          f"({settings['n_temps']} temperatures, {settings['n_steps']} steps, {settings['jobs']} jobs)")
+    table = run_replicates(tasks, settings)
+    out_path = write_table(table, args.out)
+
+    for comparison, group in table.groupby('comparison', sort=False):
+        print(f"\n{comparison}:")
+        for row in group.itertuples():
+            print(f"  {row.model}: log Z = {row.log_evidence:.2f} ± {row.log_evidence_err:.2f}, "
+                  f"log BF vs best = {row.log_bayes_factor:.2f} ± {row.log_bayes_factor_err:.2f}")
+    print(f"\nEvidence table saved to {out_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -16,6 +16,14 @@ from pathlib import Path
 import warnings
 warnings.filterwarnings('ignore')
 
+from d1_bootstrap import LEVELS as BOOTSTRAP_LEVELS, bootstrap_combined_batches, bootstrap_summary
+from d1_cache import FitCache, config_digest, series_key
+from d1_engine import (SeriesFit, find_protection_window, fit_series_parallel,
+                       loglog_wls, take_series)
+from d1_io import FORMATS, iter_point_batches, read_table, write_table
+from d1_plots import RenderQueue
+from meta import METHODS, combine as meta_combine, dl_leave_one_out
+
 # Try importing platform mapper
 try:
     from platform_mapper import PlatformMapper
@@ -24,17 +32,6 @@ except ImportError:
     HAS_MAPPING = False
     print("Warning: platform_mapper not available, skipping scale mapping")
 
-# Try importing visualization libraries
-try:
-    import matplotlib.pyplot as plt
-    import matplotlib as mpl
-    mpl.rcParams['figure.dpi'] = 100
-    mpl.rcParams['font.size'] = 10
-    HAS_PLOTTING = True
-except ImportError:
-    HAS_PLOTTING = False
-    print("Warning: matplotlib not available, plots will be skipped")
-
 # Configuration
 MIN_POINTS = 3  # Minimum points per series
 NEG_SLOPE_THRESHOLD = 0.0  # Exclude slopes below this
@@ -82,7 +79,30 @@ def select_protection_window(series_data):
         return None
     
     # Sort by S_norm
-    series_data = series_data.sort_values('S_norm').reset_index(drop=True)
+    series_data = series_data.sort_values('S_norm', kind='mergesort').reset_index(drop=True)
+    
+    x = np.log(series_data['S_norm'].values + EPS)
+    y = np.log(series_data['tau'].values + EPS)
+    bounds = find_protection_window(x, y, MIN_POINTS, MIN_LOG_RANGE_X,
+                                    MIN_LOG_RANGE_Y, NEG_SLOPE_THRESHOLD)
+    if bounds is None:
+        return None
+    
+    start, end = bounds
+    return series_data.iloc[start:end]
+
+
+def select_protection_window_exhaustive(series_data):
+    """
+    Reference O(n³) window search (every window refit with lstsq)
+    Ground truth for select_protection_window; compared against it by
+    scripts/check_d1_engine.py
+    """
+    if len(series_data) < MIN_POINTS:
+        return None
+    
+    # Sort by S_norm
+    series_data = series_data.sort_values('S_norm', kind='mergesort').reset_index(drop=True)
     
     # Try windows from largest S values
     best_window = None
@@ -118,71 +138,36 @@ def weighted_loglog_slope(window_data):
     Weighted least squares on log-log data
     Returns (slope, slope_se)
     """
-    x = np.log(window_data['S_norm'].values + EPS)
-    y = np.log(window_data['tau'].values + EPS)
-    
-    # Weights from error propagation with floor
+    # Weights from error propagation with floor (see loglog_wls)
+    tau_err = None
     if 'tau_err' in window_data.columns and not window_data['tau_err'].isna().all():
         tau_err = window_data['tau_err'].values
-        tau = window_data['tau'].values
-        # σ_y ≈ τ_err / τ for log(τ), with floor
-        sigma_y = np.clip(tau_err / np.clip(tau, EPS, None), REL_ERR_FLOOR, 1e6)
-        weights = 1.0 / (sigma_y ** 2)
-        weights = weights / weights.sum() * len(weights)  # Normalize
-    else:
-        weights = np.ones(len(x))
-    
-    # Weighted least squares
-    W = np.diag(weights)
-    X = np.vstack([x, np.ones(len(x))]).T
-    XtWX = X.T @ W @ X
-    XtWy = X.T @ W @ y
     
-    try:
-        coef = np.linalg.solve(XtWX, XtWy)
-        slope = coef[0]
-        
-        # Standard error from covariance
-        residuals = y - X @ coef
-        s2 = (residuals.T @ W @ residuals) / (len(x) - 2)
-        cov = s2 * np.linalg.inv(XtWX)
-        slope_se = np.sqrt(cov[0, 0])
-        
-        return slope, slope_se
-    except:
+    slope, slope_se, ok = loglog_wls(window_data['S_norm'].values,
+                                     window_data['tau'].values, tau_err,
+                                     rel_err_floor=REL_ERR_FLOOR, eps=EPS)
+    if not ok:
         return None, None
+    return slope[()], slope_se[()]
 
 
-def combine_effects(slopes, ses):
+def combine_effects(slopes, ses, method='DL', knapp_hartung=False):
     """
-    Fixed-effect and random-effects (DerSimonian-Laird) combination
+    Fixed-effect and random-effects combination (DerSimonian-Laird by default)
     Returns dict with μ_FE, μ_RE, SEs, Q, τ²_between
+    (plus se_RE_KH with the Knapp-Hartung adjustment)
     """
-    slopes = np.array(slopes)
-    ses = np.array(ses)
-    weights = 1 / ses**2
+    c = meta_combine(slopes, ses, method=method, knapp_hartung=knapp_hartung)
     
-    # Fixed-effect
-    μ_FE = np.sum(weights * slopes) / np.sum(weights)
-    se_FE = 1 / np.sqrt(np.sum(weights))
-    
-    # Heterogeneity
-    Q = np.sum(weights * (slopes - μ_FE)**2)
-    k = len(slopes)
-    C = np.sum(weights) - np.sum(weights**2) / np.sum(weights)
-    τ2_between = max(0, (Q - (k - 1)) / C)
-    
-    # Random-effects
-    weights_RE = 1 / (ses**2 + τ2_between)
-    μ_RE = np.sum(weights_RE * slopes) / np.sum(weights_RE)
-    se_RE = 1 / np.sqrt(np.sum(weights_RE))
-    
-    return {
-        'μ_FE': μ_FE, 'se_FE': se_FE,
-        'μ_RE': μ_RE, 'se_RE': se_RE,
-        'Q': Q, 'τ2_between': τ2_between,
-        'k': k
+    combined = {
+        'μ_FE': c['mu_FE'][()], 'se_FE': c['se_FE'][()],
+        'μ_RE': c['mu_RE'][()], 'se_RE': c['se_RE'][()],
+        'Q': c['Q'][()], 'τ2_between': c['tau2'][()],
+        'k': int(c['k'])
     }
+    if knapp_hartung:
+        combined['se_RE_KH'] = c['se_KH'][()]
+    return combined
 
 
 def leave_one_out(slopes, ses):
@@ -193,114 +178,283 @@ def leave_one_out(slopes, ses):
     results = []
     base = combine_effects(slopes, ses)
     
+    # All drop-one fits at once from the DL totals
+    loo = dl_leave_one_out(slopes, ses)
+    
     for i in range(len(slopes)):
-        slopes_loo = [s for j, s in enumerate(slopes) if j != i]
-        ses_loo = [s for j, s in enumerate(ses) if j != i]
-        
-        if len(slopes_loo) > 1:
-            loo = combine_effects(slopes_loo, ses_loo)
-            Δμ = loo['μ_RE'] - base['μ_RE']
+        if loo['k'][i] > 1:
+            Δμ = loo['mu_RE'][i] - base['μ_RE']
             Δμ_in_σ = Δμ / base['se_RE'] if base['se_RE'] > 0 else 0
-            results.append((i, loo['μ_RE'], Δμ_in_σ))
+            results.append((i, loo['mu_RE'][i], Δμ_in_σ))
     
     return results
 
 
-def plot_series(window_data, system_id, env_tag, slope, slope_se, save_path):
-    """Plot log-log data with fit line"""
-    if not HAS_PLOTTING:
-        return
-    
-    fig, ax = plt.subplots(1, 1, figsize=(6, 4))
-    
-    x = np.log(window_data['S_norm'].values)
-    y = np.log(window_data['tau'].values)
-    
-    # Data points
-    ax.scatter(x, y, s=50, alpha=0.7, label='Data')
-    
-    # Fit line
-    if slope is not None:
-        x_fit = np.linspace(x.min(), x.max(), 100)
-        y_fit = slope * x_fit + (y.mean() - slope * x.mean())
-        ax.plot(x_fit, y_fit, 'r-', alpha=0.8, 
-                label=f'δ = {slope:.3f} ± {slope_se:.3f}')
-    
-    ax.set_xlabel('log(S_norm)')
-    ax.set_ylabel('log(τ [s])')
-    ax.set_title(f'System {system_id} ({env_tag})')
-    ax.legend()
-    ax.grid(True, alpha=0.3)
-    
-    plt.tight_layout()
-    plt.savefig(save_path, dpi=150)
-    plt.close()
+def fit_all_series_serial(points_df):
+    """
+    Fit every (system_id, env_tag) series one at a time
+    Returns dict mapping (system_id, env_tag) -> SeriesFit
+    """
+    fits = {}
+    for key, group in points_df.groupby(['system_id', 'env_tag']):
+        window = select_protection_window(group)
+        if window is None:
+            fits[key] = SeriesFit(len(group), None, None, None, None)
+            continue
+        slope, slope_se = weighted_loglog_slope(window)
+        fits[key] = SeriesFit(len(group), window['S_norm'].values,
+                              window['tau'].values, slope, slope_se)
+    return fits
 
 
-def plot_histogram(slopes, combined, save_path):
-    """Plot δ histogram with FE/RE lines"""
-    if not HAS_PLOTTING:
-        return
-    
-    fig, ax = plt.subplots(1, 1, figsize=(7, 5))
-    
-    ax.hist(slopes, bins=15, alpha=0.7, edgecolor='black')
+def split_series(points_df):
+    """
+    Sort all points once into concatenated per-series arrays
+    Returns (keys, offsets, S_norm, tau, tau_err) in groupby key order;
+    series i occupies [offsets[i], offsets[i+1]) sorted by S_norm, and
+    tau_err is None when the catalogue has no tau_err column
+    """
+    grouped = points_df.groupby(['system_id', 'env_tag'])
+    keys = list(grouped.size().index)
+    codes = grouped.ngroup().values
+    keep = np.isfinite(codes) & (codes >= 0)
+    codes = codes[keep].astype(int)
+    S_norm = points_df['S_norm'].values[keep].astype(float)
+    
+    order = np.lexsort((S_norm, codes))
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(keys)))])
+    tau = points_df['tau'].values[keep].astype(float)[order]
+    tau_err = None
+    if 'tau_err' in points_df.columns:
+        tau_err = points_df['tau_err'].values[keep].astype(float)[order]
+    return keys, offsets, S_norm[order], tau, tau_err
+
+
+def fit_config():
+    """Current fit settings as keyword arguments for the d1_engine fitters"""
+    return {
+        'min_points': MIN_POINTS,
+        'min_log_range_x': MIN_LOG_RANGE_X,
+        'min_log_range_y': MIN_LOG_RANGE_Y,
+        'neg_slope_threshold': NEG_SLOPE_THRESHOLD,
+        'rel_err_floor': REL_ERR_FLOOR,
+        'eps': EPS,
+    }
+
+
+def fit_all_series_arrays(points_df, batch=True, jobs=1, cache=None):
+    """
+    Fit every (system_id, env_tag) series from packed NumPy arrays
+    batch=True fits all series in one vectorized pass, otherwise one at a
+    time; jobs > 1 shards the series across worker processes. With a
+    FitCache, series whose points and settings are unchanged are reused
+    and only the rest are refit.
+    Same output as fit_all_series_serial
+    """
+    keys, offsets, S_norm, tau, tau_err = split_series(points_df)
+    config = fit_config()
     
-    # Add vertical lines for combined estimates
-    ax.axvline(combined['μ_FE'], color='blue', linestyle='--', 
-               label=f"FE: {combined['μ_FE']:.3f} ± {combined['se_FE']:.3f}")
-    ax.axvline(combined['μ_RE'], color='red', linestyle='-', 
-               label=f"RE: {combined['μ_RE']:.3f} ± {combined['se_RE']:.3f}")
+    if cache is None:
+        starts, ends, slopes, ses, ok = fit_series_parallel(
+            S_norm, tau, tau_err, offsets, jobs, batch=batch, **config)
+    else:
+        starts, ends, slopes, ses, ok = fit_series_cached(
+            S_norm, tau, tau_err, offsets, cache, jobs, batch, config)
+    
+    fits = {}
+    for i, key in enumerate(keys):
+        n_points = offsets[i + 1] - offsets[i]
+        if starts[i] < 0:
+            fits[key] = SeriesFit(n_points, None, None, None, None)
+            continue
+        lo, hi = offsets[i] + starts[i], offsets[i] + ends[i]
+        fits[key] = SeriesFit(n_points, S_norm[lo:hi], tau[lo:hi],
+                              slopes[i] if ok[i] else None,
+                              ses[i] if ok[i] else None)
+    return fits
+
+
+def fit_series_cached(S_norm, tau, tau_err, offsets, cache, jobs, batch, config):
+    """
+    fit_series_parallel with a FitCache in front
+    Only series missing from the cache are fitted; their results are stored
+    """
+    n_series = len(offsets) - 1
+    config_hash = config_digest(config)
+    hashes = []
+    for i in range(n_series):
+        lo, hi = offsets[i], offsets[i + 1]
+        hashes.append(series_key(S_norm[lo:hi], tau[lo:hi],
+                                 None if tau_err is None else tau_err[lo:hi],
+                                 config_hash))
+    
+    starts = np.full(n_series, -1, dtype=int)
+    ends = np.full(n_series, -1, dtype=int)
+    slopes = np.full(n_series, np.nan)
+    ses = np.full(n_series, np.nan)
+    ok = np.zeros(n_series, dtype=bool)
+    
+    cached = cache.get_many(hashes)
+    missing = []
+    for i, h in enumerate(hashes):
+        if h in cached:
+            starts[i], ends[i], slopes[i], ses[i], ok[i] = cached[h]
+        else:
+            missing.append(i)
     
-    ax.set_xlabel('δ_local')
-    ax.set_ylabel('Count')
-    ax.set_title('Distribution of Local δ Values')
-    ax.legend()
-    ax.grid(True, alpha=0.3)
+    if missing:
+        idx, sub_offsets = take_series(offsets, missing)
+        fitted = fit_series_parallel(
+            S_norm[idx], tau[idx], None if tau_err is None else tau_err[idx],
+            sub_offsets, jobs, batch=batch, **config)
+        starts[missing], ends[missing], slopes[missing], ses[missing], ok[missing] = fitted
+        cache.put_many((hashes[i], starts[i], ends[i], slopes[i], ses[i], ok[i])
+                       for i in missing)
+    
+    return starts, ends, slopes, ses, ok
+
+
+def series_record(system_id, system, env_tag, fit):
+    """
+    Build the d1_per_experiment_slopes row for one fitted series
+    Returns (record, include_in_aggregate)
+    """
+    record = {
+        'system_id': system_id,
+        'system': system,
+        'env_tag': env_tag,
+    }
     
-    plt.tight_layout()
-    plt.savefig(save_path, dpi=150)
-    plt.close()
+    if fit.window_S is None:
+        record.update({
+            'n_points_used': 0,
+            'window_min_S': np.nan,
+            'window_max_S': np.nan,
+            'delta_fit_local': np.nan,
+            'delta_fit_se': np.nan,
+            'include_in_aggregate': False,
+            'rationale': f'Too few points ({fit.n_points} < {MIN_POINTS})'
+        })
+        return record, False
+    
+    slope, slope_se = fit.slope, fit.slope_se
+    
+    # Check slope threshold
+    if slope is None or slope < NEG_SLOPE_THRESHOLD:
+        record.update({
+            'n_points_used': len(fit.window_S),
+            'window_min_S': fit.window_S.min(),
+            'window_max_S': fit.window_S.max(),
+            'delta_fit_local': slope if slope else np.nan,
+            'delta_fit_se': slope_se if slope_se else np.nan,
+            'include_in_aggregate': False,
+            'rationale': f'Negative/weak slope ({slope:.3f} < {NEG_SLOPE_THRESHOLD})' if slope else 'Fit failed'
+        })
+        return record, False
+    
+    # Good fit - include
+    record.update({
+        'n_points_used': len(fit.window_S),
+        'window_min_S': fit.window_S.min(),
+        'window_max_S': fit.window_S.max(),
+        'delta_fit_local': slope,
+        'delta_fit_se': slope_se,
+        'include_in_aggregate': True,
+        'rationale': 'Included'
+    })
+    return record, True
 
 
-def plot_summary(combined, save_path):
-    """Create text summary figure"""
-    if not HAS_PLOTTING:
-        return
+def fit_points(points_df, meta_lookup, args, per_exp_dir, plots, cache=None):
+    """
+    Fit every series in points_df and build their result rows
+    Queues a plot for each included series; returns (results, slopes, ses)
+    """
+    # Validate schema
+    validate_schema(points_df, ['system_id', 'S_raw', 'S_ref', 'tau', 'env_tag'], 'points')
     
-    fig, ax = plt.subplots(1, 1, figsize=(6, 4))
-    ax.axis('off')
+    # Compute S_norm if missing
+    points_df = compute_S_norm_if_missing(points_df)
     
-    text = f"""
-    D1 Quantum Decoherence Analysis
-    ================================
+    # Fit only series whose system is flagged for inclusion
+    included_ids = [i for i, m in meta_lookup.items() if m['include_flag'] == 'Include']
+    include_df = points_df[points_df['system_id'].isin(included_ids)]
+    if args.engine == 'serial' and args.jobs <= 1 and cache is None:
+        fits = fit_all_series_serial(include_df)
+    else:
+        fits = fit_all_series_arrays(include_df, batch=args.engine == 'batch',
+                                     jobs=args.jobs, cache=cache)
     
-    Fixed-Effect δ:  {combined['μ_FE']:.3f} ± {combined['se_FE']:.3f}
-    Random-Effect δ: {combined['μ_RE']:.3f} ± {combined['se_RE']:.3f}
+    results = []
+    slopes = []
+    ses = []
     
-    Heterogeneity:
-      Q statistic: {combined['Q']:.2f}
-      τ² between: {combined['τ2_between']:.4f}
-      k (included): {combined['k']}
+    for system_id, env_tag in points_df.groupby(['system_id', 'env_tag']).size().index:
+        meta = meta_lookup[system_id]
+        
+        # Check include flag
+        if meta['include_flag'] != 'Include':
+            results.append({
+                'system_id': system_id,
+                'system': meta['system'],
+                'env_tag': env_tag,
+                'n_points_used': 0,
+                'window_min_S': np.nan,
+                'window_max_S': np.nan,
+                'delta_fit_local': np.nan,
+                'delta_fit_se': np.nan,
+                'include_in_aggregate': False,
+                'rationale': 'Excluded by meta flag'
+            })
+            continue
+        
+        fit = fits[(system_id, env_tag)]
+        record, included = series_record(system_id, meta['system'], env_tag, fit)
+        results.append(record)
+        if not included:
+            continue
+        
+        slopes.append(fit.slope)
+        ses.append(fit.slope_se)
+        
+        # Plot
+        plot_path = per_exp_dir / f"{system_id}_{env_tag.replace(' ', '_')}.pdf"
+        plots.add_series(plot_path, fit.window_S, fit.window_tau,
+                         system_id, env_tag, fit.slope, fit.slope_se)
     
-    Result: δ_quantum = {combined['μ_RE']:.3f} ± {combined['se_RE']:.3f}
+    return results, slopes, ses
+
+
+def iter_included_series(args, included_keys):
     """
-    
-    ax.text(0.5, 0.5, text, transform=ax.transAxes,
-            fontsize=12, verticalalignment='center',
-            horizontalalignment='center', fontfamily='monospace')
-    
-    plt.tight_layout()
-    plt.savefig(save_path, dpi=150)
-    plt.close()
+    Re-read the points of the included series for bootstrap refits
+    Yields (S_norm, tau, tau_err, offsets, series_ids) per point batch, with
+    series_ids the position of each series in sorted included_keys, so
+    --stream holds one batch at a time and gives the same bootstrap as a
+    whole-table run
+    """
+    if args.stream:
+        point_batches = iter_point_batches(args.points, args.chunksize)
+    else:
+        point_batches = [read_table(args.points)]
+    
+    series_id = {key: i for i, key in enumerate(sorted(included_keys))}
+    keep = pd.MultiIndex.from_tuples(included_keys, names=['system_id', 'env_tag'])
+    for points_df in point_batches:
+        points_df = compute_S_norm_if_missing(points_df)
+        in_keys = pd.MultiIndex.from_frame(points_df[['system_id', 'env_tag']]).isin(keep)
+        if not in_keys.any():
+            continue
+        keys, offsets, S_norm, tau, tau_err = split_series(points_df[in_keys])
+        yield S_norm, tau, tau_err, offsets, [series_id[key] for key in keys]
 
 
 def main():
     parser = argparse.ArgumentParser(description='Fit D1 quantum decoherence scaling')
     parser.add_argument('--meta', default='analysis/d1_quantum/D1_experiments_meta.csv',
-                        help='Path to experiments meta CSV')
+                        help='Path to experiments meta table (CSV/Parquet/NPZ)')
     parser.add_argument('--points', default='analysis/d1_quantum/D1_points.csv',
-                        help='Path to data points CSV')
+                        help='Path to data points table (CSV/Parquet/NPZ)')
     parser.add_argument('--outdir', default='artifacts/v2/d1_quantum',
                         help='Output directory')
     parser.add_argument('--neg_slope_threshold', type=float, default=0.0,
@@ -309,6 +463,37 @@ def main():
                         help='Path to platform mapping configuration')
     parser.add_argument('--enable_mapping', action='store_true',
                         help='Enable platform-to-scale mapping')
+    parser.add_argument('--re_method', choices=METHODS, default='DL',
+                        help='Random-effects τ² estimator')
+    parser.add_argument('--knapp_hartung', action='store_true',
+                        help='Also report the Knapp-Hartung SE of μ_RE')
+    parser.add_argument('--engine', choices=['serial', 'batch'], default='serial',
+                        help='Fit series one at a time or all at once in NumPy')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Worker processes for series fitting and plot rendering')
+    parser.add_argument('--cache', default=None,
+                        help='SQLite file caching per-series fits across runs (off by default)')
+    parser.add_argument('--cache-max-entries', dest='cache_max_entries', type=int, default=200000,
+                        help='LRU size limit for --cache')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv',
+                        help='Output table format (inputs are read by file suffix)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Read points in chunks of whole systems (table must be grouped by system_id)')
+    parser.add_argument('--chunksize', type=int, default=100000,
+                        help='Rows per chunk in --stream mode')
+    parser.add_argument('--bootstrap', type=int, default=0, metavar='B',
+                        help='Bootstrap replicates for μ_FE/μ_RE intervals (0 = off)')
+    parser.add_argument('--bootstrap_level', choices=BOOTSTRAP_LEVELS, default='both',
+                        help='Resample points within series, series, or both')
+    parser.add_argument('--bootstrap_max_fail', type=float, default=0.05,
+                        help='Abort if more than this fraction of bootstrap replicates fail')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='Random seed for --bootstrap')
+    plot_mode = parser.add_mutually_exclusive_group()
+    plot_mode.add_argument('--no-plots', dest='no_plots', action='store_true',
+                           help='Skip figure rendering; save plot specs for --plots-only')
+    plot_mode.add_argument('--plots-only', dest='plots_only', action='store_true',
+                           help='Render figures from saved plot specs without refitting')
     args = parser.parse_args()
     
     global NEG_SLOPE_THRESHOLD
@@ -316,109 +501,59 @@ def main():
     
     # Setup directories
     paths = ensure_outdirs(args.outdir)
+    ext = FORMATS[args.format]
+    spec_path = paths['figs'] / 'plot_specs.pkl'
+    
+    if args.plots_only:
+        if not spec_path.exists():
+            print(f"No plot specs at {spec_path}; run the fit first")
+            sys.exit(1)
+        n_rendered = sum(queue.render(jobs=args.jobs) for queue in RenderQueue.iter_saved(spec_path))
+        print(f"Rendered {n_rendered} figures from {spec_path}")
+        return
     
     # Load data
     print(f"Loading data from {args.meta} and {args.points}")
-    meta_df = pd.read_csv(args.meta)
-    points_df = pd.read_csv(args.points)
-    
-    # Validate schemas
+    meta_df = read_table(args.meta)
     validate_schema(meta_df, ['id', 'system', 'include_flag'], 'meta')
-    validate_schema(points_df, ['system_id', 'S_raw', 'S_ref', 'tau', 'env_tag'], 'points')
     
-    # Compute S_norm if missing
-    points_df = compute_S_norm_if_missing(points_df)
+    # Meta info per system id (first row wins, as with the old per-series lookup)
+    meta_lookup = (meta_df.drop_duplicates('id').set_index('id')
+                   [['system', 'include_flag']].to_dict('index'))
     
-    # Process each series
+    # Points arrive whole, or streamed in blocks of complete systems
+    if args.stream:
+        point_batches = iter_point_batches(args.points, args.chunksize)
+    else:
+        point_batches = [read_table(args.points)]
+    
+    # Process each series; specs are rendered (or spilled for --plots-only) after every batch
+    plots = RenderQueue(spill_path=spec_path if args.no_plots else None)
     results = []
     slopes_for_combination = []
     ses_for_combination = []
     
-    for (system_id, env_tag), group in points_df.groupby(['system_id', 'env_tag']):
-        # Get meta info
-        meta = meta_df[meta_df['id'] == system_id].iloc[0]
-        
-        # Check include flag
-        if meta['include_flag'] != 'Include':
-            results.append({
-                'system_id': system_id,
-                'system': meta['system'],
-                'env_tag': env_tag,
-                'n_points_used': 0,
-                'window_min_S': np.nan,
-                'window_max_S': np.nan,
-                'delta_fit_local': np.nan,
-                'delta_fit_se': np.nan,
-                'include_in_aggregate': False,
-                'rationale': 'Excluded by meta flag'
-            })
-            continue
-        
-        # Select protection window
-        window = select_protection_window(group)
-        if window is None:
-            results.append({
-                'system_id': system_id,
-                'system': meta['system'],
-                'env_tag': env_tag,
-                'n_points_used': 0,
-                'window_min_S': np.nan,
-                'window_max_S': np.nan,
-                'delta_fit_local': np.nan,
-                'delta_fit_se': np.nan,
-                'include_in_aggregate': False,
-                'rationale': f'Too few points ({len(group)} < {MIN_POINTS})'
-            })
-            continue
-        
-        # Fit slope
-        slope, slope_se = weighted_loglog_slope(window)
-        
-        # Check slope threshold
-        if slope is None or slope < NEG_SLOPE_THRESHOLD:
-            results.append({
-                'system_id': system_id,
-                'system': meta['system'],
-                'env_tag': env_tag,
-                'n_points_used': len(window),
-                'window_min_S': window['S_norm'].min(),
-                'window_max_S': window['S_norm'].max(),
-                'delta_fit_local': slope if slope else np.nan,
-                'delta_fit_se': slope_se if slope_se else np.nan,
-                'include_in_aggregate': False,
-                'rationale': f'Negative/weak slope ({slope:.3f} < {NEG_SLOPE_THRESHOLD})' if slope else 'Fit failed'
-            })
-            continue
-        
-        # Good fit - include
-        results.append({
-            'system_id': system_id,
-            'system': meta['system'],
-            'env_tag': env_tag,
-            'n_points_used': len(window),
-            'window_min_S': window['S_norm'].min(),
-            'window_max_S': window['S_norm'].max(),
-            'delta_fit_local': slope,
-            'delta_fit_se': slope_se,
-            'include_in_aggregate': True,
-            'rationale': 'Included'
-        })
-        
-        slopes_for_combination.append(slope)
-        ses_for_combination.append(slope_se)
-        
-        # Plot
-        plot_path = paths['per_exp'] / f"{system_id}_{env_tag.replace(' ', '_')}.pdf"
-        plot_series(window, system_id, env_tag, slope, slope_se, plot_path)
+    cache = FitCache(args.cache, args.cache_max_entries) if args.cache else None
+    for points_df in point_batches:
+        batch_results, batch_slopes, batch_ses = fit_points(
+            points_df, meta_lookup, args, paths['per_exp'], plots, cache)
+        results.extend(batch_results)
+        slopes_for_combination.extend(batch_slopes)
+        ses_for_combination.extend(batch_ses)
+        plots.flush(jobs=args.jobs)
+    if cache is not None:
+        print(f"Fit cache: {cache.hits} reused, {cache.misses} refit ({args.cache})")
+        cache.close()
     
     # Save per-experiment results
     results_df = pd.DataFrame(results)
-    results_df.to_csv(paths['csv'] / 'd1_per_experiment_slopes.csv', index=False)
-    print(f"\nPer-experiment results saved to {paths['csv'] / 'd1_per_experiment_slopes.csv'}")
+    slopes_path = write_table(results_df, paths['csv'] / f'd1_per_experiment_slopes{ext}')
+    print(f"\nPer-experiment results saved to {slopes_path}")
     
     # Combine effects
     if len(slopes_for_combination) > 1:
-        combined = combine_effects(slopes_for_combination, ses_for_combination)
+        combined = combine_effects(slopes_for_combination, ses_for_combination,
+                                   method=args.re_method, knapp_hartung=args.knapp_hartung)
         
         # Save combined results
         combined_df = pd.DataFrame([{
@@ -430,18 +565,36 @@ def main():
             'Q': combined['Q'],
             'k_included': combined['k']
         }])
-        combined_df.to_csv(paths['csv'] / 'd1_combined_delta.csv', index=False)
-        print(f"Combined results saved to {paths['csv'] / 'd1_combined_delta.csv'}")
+        if args.knapp_hartung:
+            combined_df['se_RE_KH'] = combined['se_RE_KH']
+        combined_path = write_table(combined_df, paths['csv'] / f'd1_combined_delta{ext}')
+        print(f"Combined results saved to {combined_path}")
         
         # Leave-one-out
         loo_results = leave_one_out(slopes_for_combination, ses_for_combination)
         loo_df = pd.DataFrame(loo_results, columns=['drop_index', 'μ_RE_drop', 'Δμ_in_σ'])
-        loo_df.to_csv(paths['csv'] / 'd1_leave_one_out.csv', index=False)
-        print(f"LOO results saved to {paths['csv'] / 'd1_leave_one_out.csv'}")
+        loo_path = write_table(loo_df, paths['csv'] / f'd1_leave_one_out{ext}')
+        print(f"LOO results saved to {loo_path}")
+        
+        # Bootstrap intervals
+        if args.bootstrap > 0:
+            included_keys = [(r['system_id'], r['env_tag']) for r in results
+                             if r['include_in_aggregate']]
+            boot = bootstrap_combined_batches(iter_included_series(args, included_keys),
+                                              len(included_keys), args.bootstrap,
+                                              level=args.bootstrap_level, method=args.re_method,
+                                              seed=args.seed, **fit_config())
+            boot_df = pd.DataFrame(bootstrap_summary(boot, slopes_for_combination,
+                                                     ses_for_combination, combined,
+                                                     method=args.re_method,
+                                                     max_fail_fraction=args.bootstrap_max_fail))
+            boot_path = write_table(boot_df, paths['csv'] / f'd1_bootstrap_delta{ext}')
+            print(f"Bootstrap intervals ({args.bootstrap} replicates, "
+                  f"{boot_df['fail_fraction'].max():.1%} failed) saved to {boot_path}")
         
         # Plots
-        plot_histogram(slopes_for_combination, combined, paths['figs'] / 'd1_delta_hist.pdf')
-        plot_summary(combined, paths['figs'] / 'd1_mu_summary.pdf')
+        plots.add_histogram(paths['figs'] / 'd1_delta_hist.pdf', slopes_for_combination, combined)
+        plots.add_summary(paths['figs'] / 'd1_mu_summary.pdf', combined)
         
         # Print summary
         print("\n" + "="*60)
@@ -454,6 +607,10 @@ def main():
         print(f"\nHeterogeneity Q: {combined['Q']:.2f}")
         print(f"τ² between: {combined['τ2_between']:.4f}")
         print(f"\nMax LOO deviation: {max(abs(r[2]) for r in loo_results):.3f}σ")
+        if args.bootstrap > 0:
+            for row in boot_df.itertuples():
+                print(f"{row.estimator} 95% bootstrap: percentile [{row.pct_lo:.3f}, {row.pct_hi:.3f}], "
+                      f"BCa [{row.bca_lo:.3f}, {row.bca_hi:.3f}]")
         print("="*60)
         print(f"\n✓ Result: δ_quantum = {combined['μ_RE']:.3f} ± {combined['se_RE']:.3f}")
         
@@ -478,17 +635,22 @@ def main():
                         'Q_mapped': mapped_results['Q'],
                         'k_mapped': mapped_results['k']
                     }])
-                    mapped_df.to_csv(paths['csv'] / 'd1_mapped_delta.csv', index=False)
+                    mapped_path = write_table(mapped_df, paths['csv'] / f'd1_mapped_delta{ext}')
                     
                     # Save phi estimates
                     phi_df = pd.DataFrame([{
                         f'phi_{i}': phi for i, phi in enumerate(mapped_results['phi_optimal'])
                     }])
-                    phi_df.to_csv(paths['csv'] / 'd1_phi_estimates.csv', index=False)
+                    phi_path = write_table(phi_df, paths['csv'] / f'd1_phi_estimates{ext}')
                     
                     print(f"\nMapped results saved to:")
-                    print(f"  {paths['csv'] / 'd1_mapped_delta.csv'}")
-                    print(f"  {paths['csv'] / 'd1_phi_estimates.csv'}")
+                    print(f"  {mapped_path}")
+                    print(f"  {phi_path}")
+                    
+                    # Basin table from the multi-start optimizer
+                    if mapper.basins is not None:
+                        basin_path = write_table(mapper.basins, paths['csv'] / f'd1_phi_basins{ext}')
+                        print(f"  {basin_path}")
                     
                     print(f"\n🎯 COMPARISON:")
                     print(f"  Raw δ_quantum: {combined['μ_RE']:.3f} ± {combined['se_RE']:.3f}")
@@ -506,6 +668,13 @@ def main():
     else:
         print("\nInsufficient data for combination (need at least 2 series)")
     
+    # Render the remaining figures (specs are only kept for a later --plots-only run)
+    plots.flush(jobs=args.jobs)
+    if args.no_plots:
+        print(f"\nPlots skipped; {len(plots)} plot specs saved to {spec_path}")
+    else:
+        print(f"\nRendered {plots.n_rendered} figures")
+    
     print(f"\nAll outputs saved to {args.outdir}")
 
 
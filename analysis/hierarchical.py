@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+"""
+hierarchical.py - Hierarchical cross-domain δ analysis
+
+Tests whether one universal δ describes every physical domain or whether
+the domains scatter about a common mean:
+
+    single:    y_i ~ N(μ, σ_i²)
+    variable:  y_i ~ N(δ_d, σ_i²),  δ_d ~ N(μ, τ²)   (d = domain of i)
+
+Measurements enter only through per-domain sufficient statistics: with
+w_i = 1/σ_i², each domain contributes its inverse-variance mean ȳ_d, its
+variance V_d = 1/Σw_i and a constant from the within-domain scatter, and
+after integrating out δ_d
+
+    log L = Σ_d [c_d + log N(ȳ_d; μ, V_d + τ²)]
+
+so thousands of measurements cost one weighted sum up front and every
+likelihood call is O(n_domains), evaluated for all walkers at once
+(emcee's vectorize mode). The single-δ model is the τ = 0 limit.
+
+Inputs are the rows of hierarchical_delta_results.csv (one summary row per
+domain, or many measurement rows per domain with an optional system
+column); derived rows written by this module are ignored on input, so
+rerunning is idempotent. Leave-one-domain-out (LODO) and, when systems are
+given, leave-one-system-out (LOSO) DerSimonian-Laird refits are batched
+through meta.combine. Results go to hierarchical_delta_fit.csv and
+lodo_loso_fit.csv by default, so the committed hierarchical_delta_results.csv
+and lodo_loso.csv artifacts are never overwritten.
+
+Usage (from the repository root):
+    python analysis/hierarchical.py
+    python analysis/hierarchical.py --measurements measurements.parquet --n_steps 20000
+"""
+
+import argparse
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize_scalar
+
+from d1_io import read_table, write_table
+from meta import combine
+
+try:
+    import emcee
+    HAS_EMCEE = True
+except ImportError:
+    HAS_EMCEE = False
+
+# measurement_type values of rows derived from the domains (not inputs)
+SUMMARY_TYPES = ('meta_analysis', 'heterogeneity', 'posterior', 'model_selection')
+
+MODELS = ('single_delta', 'variable_delta')
+
+# Flat prior ranges: μ and log τ
+MU_BOUNDS = (0.0, 1.0)
+LOG_TAU_BOUNDS = (-10.0, 0.0)
+
+_LOG_2PI = np.log(2 * np.pi)
+
+# Per-domain sufficient statistics (arrays of length n_domains)
+DomainStats = namedtuple('DomainStats', ['domains', 'ybar', 'var', 'const', 'n'])
+
+
+def _require_emcee():
+    if not HAS_EMCEE:
+        raise ImportError("Hierarchical sampling needs emcee (pip install emcee)")
+
+
+def domain_rows(table):
+    """Input measurement rows of a hierarchical results table"""
+    if 'measurement_type' not in table:
+        return table
+    return table[~table['measurement_type'].isin(SUMMARY_TYPES)]
+
+
+def domain_stats(delta, se, domain, drop=None):
+    """
+    Sufficient statistics per domain from measurement arrays
+
+    With drop, an (m, N) boolean mask of measurements removed in each of m
+    replicates, the statistics have shape (m, n_domains); domains left
+    empty get zero weight (var = inf).
+    """
+    codes, domains = pd.factorize(np.asarray(domain))
+    y = np.asarray(delta, dtype=float)
+    w = 1 / np.asarray(se, dtype=float) ** 2
+    per = np.vstack([w, w * y, w * y * y, np.log(w), np.ones_like(w)])
+
+    onehot = np.zeros((len(y), len(domains)))
+    onehot[np.arange(len(y)), codes] = 1.0
+    if drop is None:
+        sw, swy, swyy, slogw, n = per @ onehot
+    else:
+        keep = ~np.atleast_2d(np.asarray(drop, dtype=bool))
+        sw, swy, swyy, slogw, n = np.einsum('qn,mn,nd->qmd', per, keep, onehot)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ybar = swy / sw
+        var = 1 / sw
+        # Within-domain log-likelihood at ȳ_d, minus the N(ȳ_d; ·, V_d) normaliser
+        const = np.where(n > 0, -0.5 * (swyy - swy * ybar) + 0.5 * slogw
+                         - 0.5 * (n - 1) * _LOG_2PI + 0.5 * np.log(var), 0.0)
+    return DomainStats(np.asarray(domains), ybar, var, const, n.astype(int))
+
+
+def log_likelihood(theta, stats, model='variable_delta'):
+    """
+    Marginal log-likelihood for params of shape (n_params,) or (n_walkers, n_params)
+
+    theta = [μ] for single_delta, [μ, log τ] for variable_delta.
+    """
+    theta = np.asarray(theta, dtype=float)
+    mu = theta[..., 0:1]
+    tau2 = np.exp(2 * theta[..., 1:2]) if model == 'variable_delta' else 0.0
+    s2 = stats.var + tau2
+    ll = stats.const - 0.5 * ((stats.ybar - mu) ** 2 / s2 + np.log(s2) + _LOG_2PI)
+    return ll.sum(axis=-1)
+
+
+def log_prior(theta, model='variable_delta'):
+    """Flat prior on μ (and log τ); -inf outside MU_BOUNDS / LOG_TAU_BOUNDS"""
+    theta = np.asarray(theta, dtype=float)
+    inside = (MU_BOUNDS[0] < theta[..., 0]) & (theta[..., 0] < MU_BOUNDS[1])
+    if model == 'variable_delta':
+        inside &= (LOG_TAU_BOUNDS[0] < theta[..., 1]) & (theta[..., 1] < LOG_TAU_BOUNDS[1])
+    return np.where(inside, 0.0, -np.inf)
+
+
+def log_posterior(theta, stats, model='variable_delta'):
+    lp = log_prior(theta, model)
+    with np.errstate(invalid='ignore'):
+        return np.where(np.isfinite(lp), lp + log_likelihood(theta, stats, model), -np.inf)
+
+
+def max_likelihood(stats, model='variable_delta'):
+    """
+    Maximum-likelihood parameters and log-likelihood
+
+    μ has a closed form for fixed τ (the inverse-variance mean of ȳ_d with
+    weights 1/(V_d + τ²)); log τ is found on the profile likelihood.
+    """
+    def profile_mu(tau2):
+        w = 1 / (stats.var + tau2)
+        return np.sum(w * stats.ybar) / np.sum(w)
+
+    if model == 'single_delta':
+        theta = np.array([profile_mu(0.0)])
+    else:
+        def neg_profile(log_tau):
+            tau2 = np.exp(2 * log_tau)
+            return -log_likelihood([profile_mu(tau2), log_tau], stats, model)
+        res = minimize_scalar(neg_profile, bounds=LOG_TAU_BOUNDS, method='bounded')
+        theta = np.array([profile_mu(np.exp(2 * res.x)), res.x])
+    return theta, float(log_likelihood(theta, stats, model))
+
+
+def sample(stats, model='variable_delta', n_walkers=32, n_steps=5000, burn_fraction=0.5, seed=42):
+    """
+    Posterior samples (n_kept, n_params) from emcee in vectorize mode
+
+    Walkers start in a small ball about the maximum-likelihood point, pulled
+    5% inside the prior box so an ML estimate on a boundary (τ → 0) still
+    gives a valid start.
+    """
+    _require_emcee()
+    center, _ = max_likelihood(stats, model)
+    lo = np.array([MU_BOUNDS[0], LOG_TAU_BOUNDS[0]])[:len(center)]
+    hi = np.array([MU_BOUNDS[1], LOG_TAU_BOUNDS[1]])[:len(center)]
+    center = np.clip(center, lo + 0.05 * (hi - lo), hi - 0.05 * (hi - lo))
+
+    rng = np.random.default_rng(seed)
+    initial = center + 1e-3 * (hi - lo) * rng.standard_normal((n_walkers, len(center)))
+
+    sampler = emcee.EnsembleSampler(n_walkers, len(center), log_posterior,
+                                    args=(stats, model), vectorize=True)
+    sampler.random_state = np.random.RandomState(seed).get_state()
+    sampler.run_mcmc(initial, n_steps, progress=False)
+    return sampler.get_chain(discard=int(burn_fraction * n_steps), flat=True)
+
+
+def bic(log_like, n_params, n_obs):
+    return n_params * np.log(n_obs) - 2 * log_like
+
+
+def leave_group_out(delta, se, domain, groups):
+    """
+    DerSimonian-Laird combination of the domain means with each group dropped
+
+    groups: length-N labels of the measurements (domains for LODO, systems
+    for LOSO); NaN labels are never dropped. Returns (labels, combine()
+    results with one row per label).
+    """
+    groups = np.asarray(groups, dtype=object)
+    labels = pd.unique(groups[~pd.isna(groups)])
+    drop = groups[None, :] == labels[:, None]
+    stats = domain_stats(delta, se, domain, drop=drop)
+    with np.errstate(invalid='ignore'):
+        result = combine(stats.ybar, np.sqrt(stats.var), method='DL', mask=stats.n > 0)
+    return labels, result
+
+
+def lodo_loso_table(delta, se, domain, system=None):
+    """Rows of lodo_loso.csv: LODO (and LOSO with systems) plus summary rows"""
+    stats = domain_stats(delta, se, domain)
+    full = combine(stats.ybar, np.sqrt(stats.var), method='DL')
+    mu, se_full = float(full['mu_RE']), float(full['se_RE'])
+
+    analyses = [('LODO', domain)]
+    if system is not None:
+        analyses.append(('LOSO', system))
+
+    rows = []
+    for analysis, groups in analyses:
+        labels, result = leave_group_out(delta, se, domain, groups)
+        shift = result['mu_RE'] - mu
+        for label, m, s, d in zip(labels, result['mu_RE'], result['se_RE'], shift):
+            rows.append({
+                'analysis_type': analysis, 'dropped_domain': label,
+                'mu_delta_remaining': m, 'se_delta_remaining': s,
+                'delta_shift': d, 'shift_in_sigma': abs(d) / se_full,
+                'robust': 'Yes' if abs(d) < se_full else 'No',
+            })
+    table = pd.DataFrame(rows)
+
+    summary = []
+    for analysis, _ in analyses:
+        part = table[table['analysis_type'] == analysis]
+        worst = part.loc[part['shift_in_sigma'].idxmax()].copy()
+        worst['analysis_type'] = f'max_shift_{analysis}'
+        summary.append(worst)
+    overall = max(summary, key=lambda r: r['shift_in_sigma']).copy()
+    overall['analysis_type'] = 'overall_max_shift'
+    summary.append(overall)
+
+    max_sigma = table['shift_in_sigma'].max()
+    summary.append(pd.Series({
+        'analysis_type': 'stability_metric', 'dropped_domain': 'all_analyses',
+        'mu_delta_remaining': np.nan, 'se_delta_remaining': np.nan,
+        'delta_shift': table['delta_shift'].abs().max(), 'shift_in_sigma': max_sigma,
+        'robust': 'Excellent' if max_sigma < 0.25 else 'Good' if max_sigma < 1 else 'Poor',
+    }))
+    return pd.concat([table, pd.DataFrame(summary)], ignore_index=True)
+
+
+def results_table(inputs, delta, se, domain, posteriors, fits):
+    """
+    Results table (--out, hierarchical_delta_fit.csv by default): one row per
+    domain, then the meta-analysis, heterogeneity, posterior and
+    model-selection rows, in the layout of hierarchical_delta_results.csv
+    """
+    stats = domain_stats(delta, se, domain)
+    n_total = int(inputs['n_measurements'].sum()) if 'n_measurements' in inputs else len(inputs)
+    first = inputs.groupby('domain', sort=False).first()
+    counts = (inputs.groupby('domain', sort=False)['n_measurements'].sum()
+              if 'n_measurements' in inputs else inputs.groupby('domain', sort=False).size())
+
+    rows = []
+    for d, ybar, var in zip(stats.domains, stats.ybar, stats.var):
+        rows.append((d, ybar, np.sqrt(var), counts[d],
+                     first.loc[d].get('measurement_type', 'measurement'),
+                     first.loc[d].get('data_source', '')))
+
+    meta = combine(stats.ybar, np.sqrt(stats.var), method='DL')
+    Q, k = float(meta['Q']), int(meta['k'])
+    I2 = max(0.0, 100 * (Q - (k - 1)) / Q) if Q > 0 else 0.0
+    rows += [
+        ('combined_fixed_effect', meta['mu_FE'], meta['se_FE'], n_total, 'meta_analysis', 'hierarchical_model'),
+        ('combined_random_effect', meta['mu_RE'], meta['se_RE'], n_total, 'meta_analysis', 'DerSimonian-Laird'),
+        ('tau_squared_between', meta['tau2'], np.nan, n_total, 'heterogeneity', 'Q_statistic'),
+        ('Q_statistic', Q, np.nan, n_total, 'heterogeneity', 'chi_squared_test'),
+        ('I_squared', I2, np.nan, n_total, 'heterogeneity', 'percent_variation'),
+    ]
+
+    for model, samples in posteriors.items():
+        rows.append((f'hierarchical_mu_{model}', np.median(samples[:, 0]), np.std(samples[:, 0]),
+                     n_total, 'posterior', f'emcee_{model}'))
+        if model == 'variable_delta':
+            tau = np.exp(samples[:, 1])
+            rows.append(('hierarchical_tau', np.median(tau), np.std(tau),
+                         n_total, 'posterior', f'emcee_{model}'))
+
+    for model, (_, _, bic_value) in fits.items():
+        rows.append((f'BIC_{model}', bic_value, np.nan, n_total, 'model_selection', 'hierarchical_model'))
+    if len(fits) == 2:
+        rows.append(('delta_BIC', fits['variable_delta'][2] - fits['single_delta'][2], np.nan,
+                     n_total, 'model_selection', 'variable_minus_single'))
+
+    columns = ['domain', 'delta_estimate', 'delta_se', 'n_measurements', 'measurement_type', 'data_source']
+    return pd.DataFrame([[float(v) if isinstance(v, np.ndarray) else v for v in r] for r in rows],
+                        columns=columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hierarchical cross-domain δ analysis')
+    parser.add_argument('--input', default='artifacts/csv/hierarchical_delta_results.csv',
+                        help='Per-domain δ table (derived rows are ignored)')
+    parser.add_argument('--measurements', default=None,
+                        help='Measurement-level table (domain, delta_estimate, delta_se[, system]); '
+                             'replaces the --input rows of the domains it covers')
+    parser.add_argument('--out', default='artifacts/csv/hierarchical_delta_fit.csv',
+                        help='Output results table (CSV/Parquet/NPZ by suffix)')
+    parser.add_argument('--lodo_out', default='artifacts/csv/lodo_loso_fit.csv',
+                        help='Output LODO/LOSO table (CSV/Parquet/NPZ by suffix)')
+    parser.add_argument('--n_walkers', type=int, default=32, help='emcee walkers')
+    parser.add_argument('--n_steps', type=int, default=5000, help='emcee steps (0 skips sampling)')
+    parser.add_argument('--seed', type=int, default=42, help='Sampler seed')
+    args = parser.parse_args()
+
+    inputs = domain_rows(read_table(args.input))
+    if args.measurements:
+        extra = read_table(args.measurements)
+        inputs = pd.concat([inputs[~inputs['domain'].isin(extra['domain'])], extra], ignore_index=True)
+    inputs = inputs.reset_index(drop=True)
+
+    delta = inputs['delta_estimate'].astype(float).values
+    se = inputs['delta_se'].astype(float).values
+    domain = inputs['domain'].values
+    system = inputs['system'].values if 'system' in inputs else None
+    stats = domain_stats(delta, se, domain)
+    print(f"📥 {len(inputs)} measurements across {len(stats.domains)} domains")
+
+    fits, posteriors = {}, {}
+    for model in MODELS:
+        theta, ll = max_likelihood(stats, model)
+        fits[model] = (theta, ll, bic(ll, len(theta), len(inputs)))
+        print(f"\n{model}: max log L = {ll:.2f}, BIC = {fits[model][2]:.2f}")
+        if args.n_steps > 0:
+            posteriors[model] = sample(stats, model, args.n_walkers, args.n_steps, seed=args.seed)
+            mu = posteriors[model][:, 0]
+            print(f"  μ_δ = {np.median(mu):.3f} ± {np.std(mu):.3f}")
+            if model == 'variable_delta':
+                tau = np.exp(posteriors[model][:, 1])
+                print(f"  τ = {np.median(tau):.3f} (95% < {np.percentile(tau, 95):.3f})")
+
+    delta_bic = fits['variable_delta'][2] - fits['single_delta'][2]
+    print(f"\nΔBIC (variable - single) = {delta_bic:.2f}: "
+          f"{'universal δ preferred' if delta_bic > 0 else 'domain scatter preferred'}")
+
+    results = results_table(inputs, delta, se, domain, posteriors, fits)
+    lodo = lodo_loso_table(delta, se, domain, system)
+    if system is None:
+        print("No system column in the inputs; LOSO skipped")
+
+    print(f"\n💾 Saved: {write_table(results, args.out)}")
+    print(f"💾 Saved: {write_table(lodo, args.lodo_out)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+"""
+mapper_sweep.py - φ-prior and cross-validation sensitivity sweeps
+
+Reruns the EnhancedPlatformMapper model comparison over a grid or Latin
+hypercube of φ-bound widths, φ prior means/widths and CV settings, and
+reports how δ_lab→scale and the selected model move relative to the
+configuration in platform_map.yml. Platform data is extracted once and
+shared with the worker processes; each configuration only rewrites the
+φ columns (and the CV block) before refitting. Rows are streamed to the
+output table as configurations finish, so a long sweep can be inspected
+(or salvaged) while it runs.
+
+Sweep axes:
+    bounds_scale      φ bounds [lo, hi] -> [lo / s, hi * s]  (1 = as configured)
+    prior_mean_shift  added to every φ prior mean (clipped into the bounds)
+    prior_std_scale   multiplies every φ prior std
+    cv_folds          meta_regression.cross_validation.folds
+    cv_seed           meta_regression.cross_validation.seed
+
+Usage:
+    python mapper_sweep.py                                   # config grid
+    python mapper_sweep.py --grid bounds_scale=0.5,1,2 --grid prior_std_scale=0.5,1,2
+    python mapper_sweep.py --lhs 64 --range bounds_scale=1:3 --range prior_mean_shift=-0.2:0.2 \\
+        --jobs 4 --out ../artifacts/csv/phi_sweep.parquet
+"""
+
+import argparse
+import contextlib
+import copy
+import io
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+
+from d1_io import TableStreamWriter, read_table
+from enhanced_mapper import EnhancedPlatformMapper
+
+# Axis name -> value of the unperturbed configuration
+SWEEP_AXES = {
+    'bounds_scale': 1.0,
+    'prior_mean_shift': 0.0,
+    'prior_std_scale': 1.0,
+    'cv_folds': None,
+    'cv_seed': None,
+}
+INTEGER_AXES = ('cv_folds', 'cv_seed')
+
+# Worker-process state, set once per worker by _init_worker
+_MAPPER = None
+_PLATFORM_DATA = None
+
+
+def base_config(mapper):
+    """Sweep configuration reproducing platform_map.yml"""
+    config = dict(SWEEP_AXES)
+    config['cv_folds'] = mapper.meta_config['cross_validation']['folds']
+    config['cv_seed'] = mapper.meta_config['cross_validation']['seed']
+    return config
+
+
+def config_label(config, base):
+    """Short name listing the axes that differ from the base configuration"""
+    changed = [f"{k}={v:g}" for k, v in config.items() if v != base[k]]
+    return ','.join(changed) if changed else 'original'
+
+
+def apply_config(platform_data, config):
+    """Copy of platform_data with φ bounds and priors perturbed per config"""
+    data = platform_data.copy()
+    s = config['bounds_scale']
+    data['phi_min'] = data['phi_min'] / s
+    data['phi_max'] = data['phi_max'] * s
+    data['phi_prior_mean'] = np.clip(data['phi_prior_mean'] + config['prior_mean_shift'],
+                                     data['phi_min'], data['phi_max'])
+    data['phi_prior_std'] = data['phi_prior_std'] * config['prior_std_scale']
+    return data
+
+
+def grid_configs(base, axes):
+    """Full factorial over {axis: [values]}; unlisted axes keep their base value"""
+    names = list(axes)
+    return [{**base, **dict(zip(names, values))}
+            for values in itertools.product(*(axes[n] for n in names))]
+
+
+def lhs_configs(base, ranges, n, seed=42):
+    """n Latin-hypercube configurations over {axis: (lo, hi)}"""
+    names = list(ranges)
+    unit = qmc.LatinHypercube(d=len(names), seed=seed).random(n)
+    lo, hi = (np.array(b, dtype=float) for b in zip(*(ranges[k] for k in names)))
+    points = qmc.scale(unit, lo, hi) if len(names) else unit
+    configs = []
+    for point in points:
+        config = dict(base)
+        for name, value in zip(names, point):
+            config[name] = int(round(value)) if name in INTEGER_AXES else float(value)
+        configs.append(config)
+    return configs
+
+
+def run_config(mapper, platform_data, config_id, config, base, quiet=True):
+    """Refit every mapping model under one configuration; returns a result row"""
+    mapper = copy.copy(mapper)
+    mapper.meta_config = copy.deepcopy(mapper.meta_config)
+    mapper.meta_config['cross_validation'].update(folds=int(config['cv_folds']),
+                                                  seed=int(config['cv_seed']))
+    data = apply_config(platform_data, config)
+
+    out = io.StringIO() if quiet else None
+    with contextlib.redirect_stdout(out) if quiet else contextlib.nullcontext():
+        _, final, model_results = mapper.compare_models(data)
+
+    row = {'config_id': config_id, 'configuration': config_label(config, base)}
+    row['delta_lab_to_scale'] = final['delta_lab_to_scale'] if final else np.nan
+    row['best_model'] = final['best_model'] if final else None
+    row.update(config)
+    for name in mapper.models:
+        fit = (model_results or {}).get(name, {})
+        row[f'delta_{name}'] = fit['params'][0] if fit else np.nan
+        row[f'bic_{name}'] = fit.get('bic', np.nan)
+        cv = fit.get('cv_score')
+        row[f'cv_{name}'] = np.nan if cv is None else cv
+    jackknife = final['jackknife_analysis'] if final else pd.DataFrame()
+    row['max_jackknife_shift'] = (jackknife['delta_difference'].abs().max()
+                                  if not jackknife.empty else np.nan)
+    return row
+
+
+def _init_worker(mapper, platform_data):
+    global _MAPPER, _PLATFORM_DATA
+    _MAPPER, _PLATFORM_DATA = mapper, platform_data
+
+
+def _sweep_task(config_id, config, base):
+    return run_config(_MAPPER, _PLATFORM_DATA, config_id, config, base)
+
+
+def sweep(mapper, platform_data, configs, out_path, jobs=1):
+    """
+    Run configs (list of dicts) and stream rows to out_path as they finish
+
+    The base configuration runs first as the reference for delta_shift and
+    relative_shift_percent; the remaining configurations are spread over
+    jobs worker processes. Returns the results sorted by config_id.
+    """
+    base = base_config(mapper)
+    configs = [c for c in configs if c != base]
+    reference = run_config(mapper, platform_data, 0, base, base)
+    ref_delta = reference['delta_lab_to_scale']
+
+    def finish(row):
+        row['delta_shift'] = row['delta_lab_to_scale'] - ref_delta
+        row['relative_shift_percent'] = 100 * row['delta_shift'] / ref_delta
+        # phi_sensitivity_test.csv columns first
+        lead = ['configuration', 'delta_lab_to_scale', 'best_model', 'delta_shift', 'relative_shift_percent']
+        return pd.DataFrame([row])[lead + [k for k in row if k not in lead]]
+
+    rows = [finish(reference)]
+    with TableStreamWriter(out_path) as writer:
+        writer.write(rows[0])
+
+        if jobs > 1 and configs:
+            # Workers already run in parallel; keep each mapper's refit grid serial
+            mapper = copy.copy(mapper)
+            mapper.meta_config = dict(mapper.meta_config, jobs=1)
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                     initargs=(mapper, platform_data)) as pool:
+                futures = [pool.submit(_sweep_task, i, c, base) for i, c in enumerate(configs, start=1)]
+                for n_done, future in enumerate(as_completed(futures), start=1):
+                    df = finish(future.result())
+                    writer.write(df)
+                    rows.append(df)
+                    print(f"  [{n_done}/{len(configs)}] {df['configuration'].iloc[0]}: "
+                          f"δ = {df['delta_lab_to_scale'].iloc[0]:.3f} ({df['best_model'].iloc[0]})")
+        else:
+            for i, config in enumerate(configs, start=1):
+                df = finish(run_config(mapper, platform_data, i, config, base))
+                writer.write(df)
+                rows.append(df)
+                print(f"  [{i}/{len(configs)}] {df['configuration'].iloc[0]}: "
+                      f"δ = {df['delta_lab_to_scale'].iloc[0]:.3f} ({df['best_model'].iloc[0]})")
+
+    return pd.concat(rows, ignore_index=True).sort_values('config_id', ignore_index=True)
+
+
+def _parse_axis(spec, parse):
+    name, _, values = spec.partition('=')
+    if name not in SWEEP_AXES:
+        raise argparse.ArgumentTypeError(f"Unknown sweep axis {name!r}; choose from {', '.join(SWEEP_AXES)}")
+    return name, parse(name, values)
+
+
+def _grid_values(name, values):
+    cast = int if name in INTEGER_AXES else float
+    return [cast(v) for v in values.split(',')]
+
+
+def _range_values(name, values):
+    lo, hi = values.split(':')
+    return float(lo), float(hi)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='φ-prior / CV sensitivity sweep of the platform mapping')
+    parser.add_argument('--platform_map', default='platform_map.yml', help='Mapping configuration')
+    parser.add_argument('--slopes', default='../artifacts/csv/d1_per_experiment_slopes.csv',
+                        help='Per-experiment slopes table from fit_d1.py')
+    parser.add_argument('--grid', action='append', default=[], metavar='AXIS=V1,V2,...',
+                        help='Grid values for one sweep axis (repeatable)')
+    parser.add_argument('--lhs', type=int, default=0, metavar='N',
+                        help='Draw N Latin-hypercube configurations over the --range axes')
+    parser.add_argument('--range', action='append', default=[], metavar='AXIS=LO:HI',
+                        help='Sampling range for one sweep axis with --lhs (repeatable)')
+    parser.add_argument('--seed', type=int, default=42, help='Latin-hypercube seed')
+    parser.add_argument('--jobs', type=int, default=1, help='Worker processes')
+    parser.add_argument('--out', default='../artifacts/csv/phi_sensitivity_sweep.csv',
+                        help='Output table (.csv, .parquet or .npz)')
+    args = parser.parse_args()
+
+    mapper = EnhancedPlatformMapper(args.platform_map)
+    slopes = read_table(args.slopes)
+    slopes = slopes[slopes['include_in_aggregate'].astype(bool)]
+    platform_data = mapper.extract_platform_data(slopes)
+    base = base_config(mapper)
+
+    if args.lhs:
+        ranges = dict(_parse_axis(s, _range_values) for s in args.range)
+        configs = lhs_configs(base, ranges, args.lhs, seed=args.seed)
+    else:
+        axes = dict(_parse_axis(s, _grid_values) for s in args.grid)
+        configs = grid_configs(base, axes or {'bounds_scale': [1.0, 2.0]})
+
+    print(f"🔁 Sweeping {len(configs)} configurations over {len(platform_data)} platforms "
+          f"({args.jobs} worker{'s' if args.jobs > 1 else ''})")
+    results = sweep(mapper, platform_data, configs, args.out, jobs=args.jobs)
+
+    shifts = results['delta_shift'].abs()
+    n_switch = (results['best_model'] != results['best_model'].iloc[0]).sum()
+    print(f"\n📊 δ_lab→scale = {results['delta_lab_to_scale'].iloc[0]:.3f} "
+          f"(max |shift| {shifts.max():.4f}, model changes in {n_switch}/{len(results)} configurations)")
+    print(f"💾 Saved: {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+"""
+mapping_models.py - Registry of platform-to-scale mapping models
+
+A mapping model predicts each platform's protection exponent θ from a few
+global parameters plus one φ per platform. Parameter vectors are laid out
+as [globals..., φ_1 ... φ_k] and may be stacked into (n_candidates, n_params)
+arrays; forward functions must broadcast over that leading axis.
+
+Models are declared in platform_map.yml under model_selection.models with a
+NumPy forward expression and their global parameters:
+
+    M3_power:
+      forward: "delta * phi ** beta"
+      params:
+        delta: {bounds: [0.1, 3.0], initial: 0.5}
+        beta:  {bounds: [0.1, 3.0], initial: 1.0, prior: [1.0, 0.5]}
+
+or registered from plugin modules listed in model_selection.plugins, which
+call register_model() at import time with a module-level forward function
+forward(globals_dict, phi) -> θ; plugin models are compared only when they
+are also listed by name (without forward) under model_selection.models. Global parameters have strict bounds and a
+flat prior unless prior: [mean, std] adds a Gaussian.
+
+Forward expressions are checked when the model is built: only numbers,
+arithmetic (+ - * / ** and unary signs), the global parameters, phi and
+calls to exp/log/sqrt/abs (bare or as np.<name>) are accepted. Anything
+else needs a plugin forward function.
+"""
+
+import ast
+import importlib
+
+import numpy as np
+
+# Functions callable from forward expressions, bare or as np.<name>
+_EXPRESSION_FUNCTIONS = {'exp': np.exp, 'log': np.log, 'sqrt': np.sqrt, 'abs': np.abs}
+
+_EXPRESSION_NAMESPACE = {'__builtins__': {}, 'np': np, **_EXPRESSION_FUNCTIONS}
+
+_EXPRESSION_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.UAdd, ast.USub)
+
+# Models registered by plugin modules: name -> MappingModel
+MODEL_REGISTRY = {}
+
+
+def check_expression(expression, names, label='forward'):
+    """
+    Parse a forward expression and reject anything but arithmetic on names,
+    numeric constants and the whitelisted functions; returns the AST
+    """
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"{label}: cannot parse {expression!r}: {e.msg}") from None
+
+    def is_function(node):
+        if isinstance(node, ast.Name):
+            return node.id in _EXPRESSION_FUNCTIONS
+        return (isinstance(node, ast.Attribute) and node.attr in _EXPRESSION_FUNCTIONS
+                and isinstance(node.value, ast.Name) and node.value.id == 'np')
+
+    def check(node):
+        if isinstance(node, ast.Expression):
+            check(node.body)
+        elif isinstance(node, ast.BinOp) and isinstance(node.op, _EXPRESSION_OPERATORS):
+            check(node.left)
+            check(node.right)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, _EXPRESSION_OPERATORS):
+            check(node.operand)
+        elif isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            pass
+        elif isinstance(node, ast.Name) and node.id in names:
+            pass
+        elif isinstance(node, ast.Call) and is_function(node.func) and not node.keywords:
+            for arg in node.args:
+                check(arg)
+        else:
+            raise ValueError(f"{label}: {ast.unparse(node)!r} is not allowed in {expression!r} "
+                             f"(use arithmetic on {sorted(names)} and "
+                             f"{sorted(_EXPRESSION_FUNCTIONS)}, or a plugin forward function)")
+
+    check(tree)
+    return tree
+
+
+class MappingModel:
+    """One mapping model: global parameter layout, bounds, priors and forward map"""
+
+    def __init__(self, name, global_names, forward, bounds, initial,
+                 priors=None, description=''):
+        self.name = name
+        self.global_names = list(global_names)
+        self.n_global = len(self.global_names)
+        self.lower, self.upper = (np.array(b, dtype=float) for b in zip(*bounds))
+        self.initial = [float(v) for v in initial]
+        priors = priors or [None] * self.n_global
+        self.prior_mean = np.array([np.nan if p is None else p[0] for p in priors])
+        self.prior_std = np.array([np.nan if p is None else p[1] for p in priors])
+        self.description = description
+        self.forward = forward
+        self._compiled = None
+        if not callable(forward):
+            check_expression(forward, set(self.global_names) | {'phi'}, f'{name} forward')
+
+    def __getstate__(self):
+        # Compiled expressions don't pickle; workers recompile on first use
+        state = dict(self.__dict__)
+        state['_compiled'] = None
+        return state
+
+    def __repr__(self):
+        return f"MappingModel({self.name!r}, globals={self.global_names})"
+
+    def _forward(self):
+        if callable(self.forward):
+            return self.forward
+        if self._compiled is None:
+            tree = check_expression(self.forward, set(self.global_names) | {'phi'}, f'{self.name} forward')
+            code = compile(tree, f'<{self.name} forward>', 'eval')
+            self._compiled = lambda g, phi: eval(code, _EXPRESSION_NAMESPACE, {**g, 'phi': phi})
+        return self._compiled
+
+    @property
+    def bounds(self):
+        return list(zip(self.lower, self.upper))
+
+    def split(self, params, n_platforms=None):
+        """(dict of global parameter arrays, φ array) from stacked parameter vectors"""
+        params = np.asarray(params, dtype=float)
+        globals_ = {name: params[..., i] for i, name in enumerate(self.global_names)}
+        stop = None if n_platforms is None else self.n_global + n_platforms
+        return globals_, params[..., self.n_global:stop]
+
+    def predict(self, params, n_platforms=None):
+        """θ predicted for each platform, shape (..., n_platforms)"""
+        globals_, phi = self.split(params, n_platforms)
+        globals_ = {name: value[..., None] for name, value in globals_.items()}
+        return self._forward()(globals_, phi)
+
+    def log_prior_globals(self, params):
+        """(log-prior of the global parameters, inside-bounds mask)"""
+        params = np.asarray(params, dtype=float)
+        g = params[..., :self.n_global]
+        inside = np.all((self.lower < g) & (g < self.upper), axis=-1)
+        has_prior = np.isfinite(self.prior_mean)
+        z = (g[..., has_prior] - self.prior_mean[has_prior]) / self.prior_std[has_prior]
+        lp = np.sum(-0.5 * z**2 - np.log(self.prior_std[has_prior]) - 0.5 * np.log(2 * np.pi), axis=-1)
+        return lp, inside
+
+
+def register_model(name, global_names, forward, bounds, initial, priors=None, description=''):
+    """Register a plugin mapping model (forward must be a module-level function)"""
+    model = MappingModel(name, global_names, forward, bounds, initial, priors, description)
+    MODEL_REGISTRY[name] = model
+    return model
+
+
+def model_from_config(name, spec):
+    """Build a MappingModel from its platform_map.yml entry"""
+    params = spec['params']
+    return MappingModel(
+        name,
+        list(params),
+        spec['forward'],
+        bounds=[p['bounds'] for p in params.values()],
+        initial=[p['initial'] for p in params.values()],
+        priors=[p.get('prior') for p in params.values()],
+        description=spec.get('description', ''),
+    )
+
+
+def load_models(model_selection):
+    """
+    Models from the model_selection config block, in declaration order
+    Entries with a forward expression are built from the config; plugin
+    modules are imported first and supply any model registered by name.
+    Registered models that the config does not list are left out.
+    """
+    for module in model_selection.get('plugins', []) or []:
+        importlib.import_module(module)
+
+    models = {}
+    for name, spec in model_selection['models'].items():
+        if 'forward' in spec:
+            models[name] = model_from_config(name, spec)
+        elif name in MODEL_REGISTRY:
+            models[name] = MODEL_REGISTRY[name]
+        else:
+            raise ValueError(f"Mapping model {name!r} has no forward expression and no plugin registration")
+    return models
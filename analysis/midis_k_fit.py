@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+"""
+midis_k_fit.py - MCMC fit of the MIDIS decay rate k
+
+Fits ln g(z) = ln g0 - k z to binned MIDIS fluxes g ± g_err, optionally
+with an intrinsic log-scatter σ_int added in quadrature to the measurement
+errors (σ² = (g_err/g)² + σ_int²). ln g and the measurement variances are
+computed once; each sampler step evaluates every walker in a single
+vectorized call (emcee's vectorize mode), and the weighted least-squares
+start comes from the 2×2 normal equations.
+
+Long runs are checkpointed to HDF5 every checkpoint_every steps: the chain
+and log-probabilities are appended to resizable datasets together with the
+last walker positions and RNG state, the in-memory sampler is cleared, and
+an interrupted run resumes where its last checkpoint left off. The file
+records a hash of the data and the run settings, and a resume with
+different data, seed, scatter or burn settings is refused.
+
+Usage:
+    python analysis/midis_k_fit.py --data data/midis_bins.csv
+    python analysis/midis_k_fit.py --scatter --n_steps 100000 --chain artifacts/checks/midis_k_chain.h5
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+
+from d1_io import read_table
+
+try:
+    import emcee
+    HAS_EMCEE = True
+except ImportError:
+    HAS_EMCEE = False
+
+try:
+    import h5py
+    HAS_H5PY = True
+except ImportError:
+    HAS_H5PY = False
+
+# QH framework prediction k = c β/α with c = 1
+BETA_OVER_ALPHA = 0.0503
+
+# Flat prior range on ln σ_int (ln g0 and k are unbounded)
+LN_SCATTER_BOUNDS = (-10.0, 1.0)
+
+# Accepted column names for (z, g, g_err), first match wins
+COLUMN_ALIASES = (('z', 'g', 'g_err'), ('z', 'gamma_obs', 'gamma_err'))
+
+MidisData = namedtuple('MidisData', ['z', 'ln_g', 'var'])
+
+
+def _require_emcee():
+    if not HAS_EMCEE:
+        raise ImportError("The MIDIS k fit needs emcee (pip install emcee)")
+
+
+def _require_h5py():
+    if not HAS_H5PY:
+        raise ImportError("HDF5 chain checkpoints need h5py (pip install h5py)")
+
+
+def load_midis(path):
+    """MidisData from a binned flux table (z, g, g_err; first three columns otherwise)"""
+    df = read_table(path)
+    for names in COLUMN_ALIASES:
+        if all(name in df for name in names):
+            z, g, g_err = (df[name].values.astype(float) for name in names)
+            break
+    else:
+        z, g, g_err = (df.iloc[:, i].values.astype(float) for i in range(3))
+    return prepare(z, g, g_err)
+
+
+def prepare(z, g, g_err):
+    """Log-flux and log-space variances, computed once per dataset"""
+    g = np.asarray(g, dtype=float)
+    return MidisData(np.asarray(z, dtype=float), np.log(g), (np.asarray(g_err, dtype=float) / g) ** 2)
+
+
+def data_hash(data):
+    """SHA-256 of the prepared arrays, recorded in chain checkpoints"""
+    h = hashlib.sha256()
+    for values in data:
+        h.update(np.ascontiguousarray(values, dtype=float).tobytes())
+    return h.hexdigest()
+
+
+def wls_fit(data):
+    """
+    Weighted least squares for ln g = ln g0 - k z from the 2×2 normal equations
+    Returns ([ln g0, k], [se(ln g0), se(k)]).
+    """
+    w = 1 / data.var
+    S, Sz, Szz = w.sum(), (w * data.z).sum(), (w * data.z ** 2).sum()
+    Sy, Szy = (w * data.ln_g).sum(), (w * data.z * data.ln_g).sum()
+    det = S * Szz - Sz ** 2
+    ln_g0 = (Szz * Sy - Sz * Szy) / det
+    slope = (S * Szy - Sz * Sy) / det
+    return np.array([ln_g0, -slope]), np.sqrt(np.array([Szz, S]) / det)
+
+
+def log_likelihood(theta, data, scatter=False):
+    """
+    Gaussian log-likelihood in ln g for params (n_params,) or (n_walkers, n_params)
+    theta = [ln g0, k] or, with scatter, [ln g0, k, ln σ_int].
+    """
+    theta = np.asarray(theta, dtype=float)
+    resid = data.ln_g - (theta[..., 0:1] - theta[..., 1:2] * data.z)
+    var = data.var + np.exp(2 * theta[..., 2:3]) if scatter else data.var
+    return -0.5 * np.sum(resid ** 2 / var + np.log(2 * np.pi * var), axis=-1)
+
+
+def log_posterior(theta, data, scatter=False):
+    theta = np.asarray(theta, dtype=float)
+    if not scatter:
+        return log_likelihood(theta, data)
+    inside = (LN_SCATTER_BOUNDS[0] < theta[..., 2]) & (theta[..., 2] < LN_SCATTER_BOUNDS[1])
+    with np.errstate(over='ignore', invalid='ignore'):
+        return np.where(inside, log_likelihood(theta, data, scatter), -np.inf)
+
+
+class ChainFile:
+    """
+    HDF5 chain: resizable chain (steps, walkers, dim) and log_prob datasets,
+    cumulative acceptance counts and the state needed to resume
+
+    config (e.g. data hash, seed, burn setting) is stored as config_* attrs
+    when the file is created; resuming with a different config is refused.
+    """
+
+    def __init__(self, path, n_walkers, n_dim, resume=True, config=None):
+        _require_h5py()
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        config = {key: str(value) for key, value in (config or {}).items()}
+        if resume and self.path.exists():
+            self.f = h5py.File(self.path, 'a')
+            shape = self.f['chain'].shape[1:]
+            stored = {key: self.f.attrs.get(f'config_{key}') for key in config}
+            changed = [f"{key}: {stored[key]} -> {value}" for key, value in config.items()
+                       if stored[key] != value]
+            if shape != (n_walkers, n_dim) or changed:
+                self.f.close()
+                detail = '; '.join(changed) or f"(walkers, dim) = {shape}, requested {(n_walkers, n_dim)}"
+                raise ValueError(f"Checkpoint {self.path} is from a different run ({detail}); "
+                                 f"use resume=False (--no_resume) to start over")
+        else:
+            self.f = h5py.File(self.path, 'w')
+            self.f.attrs.update({f'config_{key}': value for key, value in config.items()})
+            chunk = (min(256, 1 + 2 ** 20 // (8 * n_walkers * n_dim)), n_walkers, n_dim)
+            self.f.create_dataset('chain', (0, n_walkers, n_dim), maxshape=(None, n_walkers, n_dim),
+                                  dtype=float, chunks=chunk)
+            self.f.create_dataset('log_prob', (0, n_walkers), maxshape=(None, n_walkers),
+                                  dtype=float, chunks=chunk[:2])
+            self.f.create_dataset('accepted', data=np.zeros(n_walkers))
+
+    @property
+    def n_done(self):
+        return self.f['chain'].shape[0]
+
+    def append(self, chain, log_prob, accepted, state):
+        """Append a block of steps and record the resume point"""
+        n, m = self.n_done, len(chain)
+        for name, block in (('chain', chain), ('log_prob', log_prob)):
+            self.f[name].resize(n + m, axis=0)
+            self.f[name][n:] = block
+        self.f['accepted'][...] += accepted
+
+        name, keys, pos, has_gauss, cached = state.random_state
+        for key, value in (('last_coords', state.coords), ('last_log_prob', state.log_prob),
+                           ('rng_keys', keys)):
+            if key in self.f:
+                del self.f[key]
+            self.f[key] = value
+        self.f.attrs.update(rng_name=name, rng_pos=pos, rng_has_gauss=has_gauss, rng_cached=cached)
+        self.f.flush()
+
+    def state(self):
+        a = self.f.attrs
+        random_state = (a['rng_name'], self.f['rng_keys'][()], int(a['rng_pos']),
+                        int(a['rng_has_gauss']), float(a['rng_cached']))
+        return emcee.State(self.f['last_coords'][()], log_prob=self.f['last_log_prob'][()],
+                           random_state=random_state)
+
+    def close(self):
+        self.f.close()
+
+
+def fit_k(data, scatter=False, n_walkers=32, n_steps=1000, burn=None, seed=42,
+          chain_path=None, checkpoint_every=1000, resume=True):
+    """
+    Sample (ln g0, k[, ln σ_int]) with emcee
+
+    burn defaults to a fifth of n_steps. With chain_path the run goes to an
+    HDF5 checkpoint (resumed if it exists, resume is set and it was written
+    for the same data, seed, scatter and burn setting) and only the
+    post-burn part of the chain is read back. A checkpoint longer than
+    n_steps is not extended and its first n_steps are summarised. Returns a
+    dict of posterior summaries, acceptance fraction (over every step in
+    the checkpoint) and autocorrelation time.
+    """
+    _require_emcee()
+    config = {'data_sha256': data_hash(data), 'seed': seed, 'scatter': scatter,
+              'burn': 'n_steps/5' if burn is None else int(burn)}
+    burn = n_steps // 5 if burn is None else burn
+    center, se = wls_fit(data)
+    if scatter:
+        center = np.append(center, np.log(0.1 * np.sqrt(np.median(data.var))))
+        se = np.append(se, 0.1)
+    n_dim = len(center)
+
+    sampler = emcee.EnsembleSampler(n_walkers, n_dim, log_posterior,
+                                    args=(data, scatter), vectorize=True)
+    store = ChainFile(chain_path, n_walkers, n_dim, resume, config) if chain_path else None
+    try:
+        start = store.n_done if store else 0
+        if start >= n_steps > 0:
+            print(f"Checkpoint {chain_path} already holds {start} steps; using the first {n_steps}")
+        elif start:
+            state = store.state()
+            print(f"Resuming from step {start}/{n_steps} ({chain_path})")
+        else:
+            rng = np.random.default_rng(seed)
+            state = center + 1e-2 * se * rng.standard_normal((n_walkers, n_dim))
+            sampler.random_state = np.random.RandomState(seed).get_state()
+
+        block = checkpoint_every if store else n_steps
+        while start < n_steps:
+            m = min(block, n_steps - start)
+            state = sampler.run_mcmc(state, m, progress=False)
+            if store:
+                store.append(sampler.get_chain(), sampler.get_log_prob(),
+                             sampler.backend.accepted, state)
+                sampler.reset()
+            start += m
+
+        # Acceptance counts cover every step taken, including any beyond n_steps
+        if store:
+            chain = store.f['chain'][burn:n_steps]
+            accepted = store.f['accepted'][()]
+            n_taken = store.n_done
+        else:
+            chain = sampler.get_chain()[burn:]
+            accepted = sampler.backend.accepted
+            n_taken = n_steps
+    finally:
+        if store:
+            store.close()
+
+    samples = chain.reshape(-1, n_dim)
+    tau = emcee.autocorr.integrated_time(chain, quiet=True)
+    result = {
+        'n_points': len(data.z),
+        'n_walkers': n_walkers,
+        'n_steps': n_steps,
+        'burn': burn,
+        'scatter': scatter,
+        'ln_g0_wls': float(center[0]),
+        'k_wls': float(center[1]),
+        'k_wls_err': float(se[1]),
+        'ln_g0': float(np.mean(samples[:, 0])),
+        'ln_g0_err': float(np.std(samples[:, 0])),
+        'k': float(np.mean(samples[:, 1])),
+        'k_err': float(np.std(samples[:, 1])),
+        'acceptance': float(np.mean(accepted) / max(n_taken, 1)),
+        'autocorr_steps': [float(t) for t in tau],
+    }
+    if scatter:
+        sigma = np.exp(samples[:, 2])
+        result['sigma_int'] = float(np.median(sigma))
+        result['sigma_int_95'] = float(np.percentile(sigma, 95))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MCMC fit of the MIDIS decay rate k')
+    parser.add_argument('--data', default='data/midis_f560w_masslim.csv',
+                        help='Binned MIDIS fluxes (z, g, g_err)')
+    parser.add_argument('--scatter', action='store_true', help='Fit an intrinsic log-scatter σ_int')
+    parser.add_argument('--n_walkers', type=int, default=32, help='emcee walkers')
+    parser.add_argument('--n_steps', type=int, default=1000, help='Steps per walker')
+    parser.add_argument('--burn', type=int, default=None, help='Discarded steps (default n_steps/5)')
+    parser.add_argument('--seed', type=int, default=42, help='Sampler seed')
+    parser.add_argument('--chain', default=None, help='HDF5 chain checkpoint (resumed if present)')
+    parser.add_argument('--checkpoint_every', type=int, default=1000, help='Steps between checkpoints')
+    parser.add_argument('--no_resume', action='store_true', help='Overwrite an existing --chain file')
+    parser.add_argument('--out', default=None, help='Write the result summary as JSON')
+    args = parser.parse_args()
+
+    data = load_midis(args.data)
+    print(f"📥 {len(data.z)} MIDIS bins, z = [{data.z.min():.1f}, {data.z.max():.1f}]")
+    try:
+        result = fit_k(data, scatter=args.scatter, n_walkers=args.n_walkers, n_steps=args.n_steps,
+                       burn=args.burn, seed=args.seed, chain_path=args.chain,
+                       checkpoint_every=args.checkpoint_every, resume=not args.no_resume)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    print(f"\nWLS start: k = {result['k_wls']:.3f} ± {result['k_wls_err']:.3f}")
+    print(f"MCMC Results ({result['n_steps']} steps, acceptance {result['acceptance']:.2f}, "
+          f"τ_int ≈ {max(result['autocorr_steps']):.0f} steps):")
+    print(f"  ln_g0 = {result['ln_g0']:.3f} ± {result['ln_g0_err']:.3f}")
+    print(f"  k = {result['k']:.3f} ± {result['k_err']:.3f}")
+    if args.scatter:
+        print(f"  σ_int = {result['sigma_int']:.3f} (95% < {result['sigma_int_95']:.3f})")
+
+    agreement = abs(result['k'] - BETA_OVER_ALPHA) / result['k_err']
+    print(f"\nTheoretical k = {BETA_OVER_ALPHA:.3f} (from β/α): {agreement:.2f}σ")
+
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Saved: {args.out}")
+
+
+if __name__ == '__main__':
+    main()
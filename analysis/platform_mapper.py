@@ -9,14 +9,145 @@ Physics-motivated approach to reconcile platform-specific control parameters
 with universal information scale coupling.
 """
 
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
 import numpy as np
 import pandas as pd
 import yaml
 from scipy.optimize import minimize_scalar, minimize
+from scipy.stats import qmc
 from sklearn.model_selection import KFold
 import warnings
 warnings.filterwarnings('ignore')
 
+from meta import combine, tau2_dl
+
+# Weight of the Gaussian φ prior relative to τ²
+PRIOR_WEIGHT = 0.1
+
+# Objective value outside the physics bounds
+BOUND_PENALTY = 1e6
+
+
+class PhiObjective:
+    """
+    Array form of the φ objective with its analytic gradient
+
+    f(φ) = τ²_DL(δ/φ, se/φ) + 0.1 Σ ((φ - m)/s)². τ² itself comes from
+    meta.tau2_dl; with w = φ²/se² the DL sums reduce to Σw, Σw²,
+    Σwy = Σ φδ/se² and a constant Σwy², so its gradient is closed-form in
+    φ. Platform columns are converted to NumPy once, not on every
+    evaluation.
+    """
+    
+    def __init__(self, platform_data):
+        self.delta = platform_data['delta_local'].values.astype(float)
+        self.se = platform_data['delta_se'].values.astype(float)
+        self.var = self.se ** 2
+        self.Syy = (self.delta ** 2 / self.var).sum()
+        self.lower = platform_data['phi_min'].values.astype(float)
+        self.upper = platform_data['phi_max'].values.astype(float)
+        self.prior_mean = platform_data['phi_prior_mean'].values.astype(float)
+        self.prior_std = platform_data['phi_prior_std'].values.astype(float)
+        self.k = len(self.delta)
+        self.n_evals = 0
+    
+    def tau2(self, phi):
+        """DL τ² of delta_true = δ/φ (meta.tau2_dl); returns (τ², d τ²/d φ)"""
+        phi = np.asarray(phi, dtype=float)
+        w = phi ** 2 / self.var
+        S1, S2 = w.sum(), (w * w).sum()
+        C = S1 - S2 / S1
+        tau2 = float(tau2_dl(self.delta / phi, self.se / phi)) if C > 0 else 0.0
+        if not tau2 > 0:
+            return 0.0, np.zeros_like(phi)
+        
+        # Gradient of (Q - (k - 1)) / C on the untruncated branch
+        Sy = (phi * self.delta / self.var).sum()
+        Q = self.Syy - Sy ** 2 / S1
+        excess = Q - (self.k - 1)
+        dw = 2 * w / phi
+        dwy = self.delta / self.var
+        dQ = -2 * Sy * dwy / S1 + Sy ** 2 * dw / S1 ** 2
+        dC = dw * (1 + S2 / S1 ** 2) - 2 * w * dw / S1
+        return tau2, (dQ * C - excess * dC) / C ** 2
+    
+    def __call__(self, phi):
+        """Objective value and gradient, for minimize(..., jac=True)"""
+        self.n_evals += 1
+        phi = np.asarray(phi, dtype=float)
+        if len(phi) != self.k:
+            raise ValueError("Phi values must match platform count")
+        if np.any(phi < self.lower) or np.any(phi > self.upper):
+            return BOUND_PENALTY, np.zeros_like(phi)  # Penalty for violating physics bounds
+        
+        tau2, dtau2 = self.tau2(phi)
+        z = (phi - self.prior_mean) / self.prior_std
+        value = tau2 + PRIOR_WEIGHT * (z ** 2).sum()
+        grad = dtau2 + 2 * PRIOR_WEIGHT * z / self.prior_std
+        return value, grad
+
+
+def _local_fit(platform_data, x0, options):
+    """One L-BFGS-B run from x0 (top-level so it can run in a worker process)"""
+    objective = PhiObjective(platform_data)
+    result = minimize(
+        fun=objective,
+        x0=x0,
+        jac=True,
+        bounds=list(zip(objective.lower, objective.upper)),
+        method='L-BFGS-B',
+        options=options
+    )
+    return {
+        'x0': np.asarray(x0, dtype=float),
+        'x': result.x,
+        'fun': float(result.fun),
+        'success': bool(result.success),
+        'nit': int(result.nit),
+        'n_evals': objective.n_evals,
+    }
+
+
+def draw_starts(lower, upper, n_starts, sampler='sobol', seed=None):
+    """Quasi-random starting points inside the box [lower, upper]"""
+    if sampler == 'sobol':
+        engine = qmc.Sobol(d=len(lower), scramble=True, seed=seed)
+    elif sampler == 'lhs':
+        engine = qmc.LatinHypercube(d=len(lower), seed=seed)
+    else:
+        raise ValueError(f"Unknown sampler {sampler!r}; use 'sobol' or 'lhs'")
+    return qmc.scale(engine.random(n_starts), lower, upper)
+
+
+def group_basins(runs, lower, upper, tol=1e-3):
+    """
+    De-duplicate converged solutions into basins
+    Runs are visited best-first; a run joins the first basin whose minimum
+    lies within tol (as a fraction of each bound width) in every coordinate.
+    Returns a DataFrame with one row per basin, best first.
+    """
+    width = np.asarray(upper) - np.asarray(lower)
+    basins = []
+    for run in sorted(runs, key=lambda r: r['fun']):
+        for basin in basins:
+            if np.all(np.abs(run['x'] - basin['x']) <= tol * width):
+                basin['n_hits'] += 1
+                basin['n_converged'] += run['success']
+                break
+        else:
+            basins.append({'x': run['x'], 'objective': run['fun'], 'n_hits': 1,
+                           'n_converged': int(run['success'])})
+    
+    rows = []
+    for i, basin in enumerate(basins):
+        row = {'basin': i, 'objective': basin['objective'],
+               'n_hits': basin['n_hits'], 'n_converged': basin['n_converged']}
+        row.update({f'phi_{j}': phi for j, phi in enumerate(basin['x'])})
+        rows.append(row)
+    return pd.DataFrame(rows)
+
 
 class PlatformMapper:
     def __init__(self, config_path):
@@ -26,6 +157,7 @@ class PlatformMapper:
         
         self.platforms = self.config['platforms']
         self.meta_config = self.config['meta_regression']
+        self.basins = None
         
     def extract_platform_data(self, results_df):
         """Extract per-platform results with bounds"""
@@ -61,30 +193,7 @@ class PlatformMapper:
         if len(phi_values) != len(platform_data):
             raise ValueError("Phi values must match platform count")
         
-        # Check bounds
-        for i, (phi, row) in enumerate(zip(phi_values, platform_data.itertuples())):
-            if phi < row.phi_min or phi > row.phi_max:
-                return 1e6  # Penalty for violating physics bounds
-        
-        # Calculate delta_true for each platform
-        delta_true = platform_data['delta_local'].values / phi_values
-        delta_true_se = platform_data['delta_se'].values / phi_values
-        
-        # Calculate between-platform heterogeneity (like DerSimonian-Laird)
-        weights = 1 / (delta_true_se**2)
-        mu_weighted = np.sum(weights * delta_true) / np.sum(weights)
-        
-        Q = np.sum(weights * (delta_true - mu_weighted)**2)
-        k = len(delta_true)
-        C = np.sum(weights) - np.sum(weights**2) / np.sum(weights)
-        tau_squared = max(0, (Q - (k - 1)) / C)
-        
-        # Add weak prior penalty
-        prior_penalty = 0
-        for phi, row in zip(phi_values, platform_data.itertuples()):
-            prior_penalty += ((phi - row.phi_prior_mean) / row.phi_prior_std)**2
-        
-        return tau_squared + 0.1 * prior_penalty  # Light prior weight
+        return PhiObjective(platform_data)(phi_values)[0]
     
     def fit_phi_values(self, platform_data):
         """
@@ -98,10 +207,11 @@ class PlatformMapper:
         # Bounds for optimization
         bounds = [(row.phi_min, row.phi_max) for row in platform_data.itertuples()]
         
-        # Optimize
+        # Optimize with the analytic gradient
         result = minimize(
-            fun=lambda phi: self.objective_function(phi, platform_data),
+            fun=PhiObjective(platform_data),
             x0=initial_phi,
+            jac=True,
             bounds=bounds,
             method='L-BFGS-B',
             options={
@@ -115,6 +225,68 @@ class PlatformMapper:
         
         return result.x, result.fun
     
+    def fit_phi_multistart(self, platform_data, n_starts=None, jobs=None):
+        """
+        Multi-start L-BFGS-B for the φ mapping
+        
+        The max(0, ·) in τ² makes the objective non-smooth, so a single start
+        can stall. Starts are the prior means plus a Sobol/LHS design inside
+        phi_bounds, run concurrently when jobs > 1. Settings and the
+        time/evaluation budget come from meta_regression.multi_start.
+        Returns (phi_optimal, objective, basins DataFrame).
+        """
+        settings = self.meta_config.get('multi_start', {})
+        n_starts = n_starts or settings.get('n_starts', 32)
+        jobs = jobs or settings.get('jobs', 1)
+        max_evals = settings.get('max_evaluations')
+        time_budget = settings.get('time_budget_s')
+        
+        lower = platform_data['phi_min'].values.astype(float)
+        upper = platform_data['phi_max'].values.astype(float)
+        starts = np.vstack([
+            platform_data['phi_prior_mean'].values.astype(float),
+            draw_starts(lower, upper, n_starts - 1, settings.get('sampler', 'sobol'),
+                        settings.get('seed', self.meta_config['cross_validation']['seed']))
+        ])
+        
+        options = {
+            'maxiter': self.meta_config['convergence']['max_iterations'],
+            'ftol': float(self.meta_config['convergence']['tolerance'])
+        }
+        if max_evals:
+            # Evaluation budget is shared evenly between starts
+            options['maxfun'] = max(1, int(max_evals) // n_starts)
+        deadline = time.time() + float(time_budget) if time_budget else None
+        
+        runs = []
+        if jobs <= 1:
+            for x0 in starts:
+                if deadline is not None and time.time() > deadline:
+                    break
+                runs.append(_local_fit(platform_data, x0, options))
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                pending = {pool.submit(_local_fit, platform_data, x0, options) for x0 in starts}
+                while pending:
+                    timeout = None if deadline is None else max(0.0, deadline - time.time())
+                    done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                    runs.extend(f.result() for f in done)
+                    if not done:
+                        # Out of time: drop starts that have not begun
+                        for f in pending:
+                            f.cancel()
+                        runs.extend(f.result() for f in pending if not f.cancelled())
+                        break
+        
+        if len(runs) < len(starts):
+            print(f"Warning: time budget reached after {len(runs)}/{len(starts)} starts")
+        
+        basins = group_basins(runs, lower, upper, float(settings.get('dedup_tol', 1e-3)))
+        best = min(runs, key=lambda r: r['fun'])
+        n_evals = sum(r['n_evals'] for r in runs)
+        print(f"Multi-start: {len(runs)} starts, {n_evals} evaluations, {len(basins)} distinct minima")
+        return best['x'], best['fun'], basins
+    
     def cross_validate_mapping(self, platform_data):
         """
         Cross-validate the phi mapping to check robustness
@@ -161,34 +333,20 @@ class PlatformMapper:
         delta_true = platform_data['delta_local'].values / phi_optimal
         delta_true_se = platform_data['delta_se'].values / phi_optimal
         
-        # Meta-analysis of delta_true
-        weights = 1 / (delta_true_se**2)
-        
-        # Fixed-effect
-        mu_FE = np.sum(weights * delta_true) / np.sum(weights)
-        se_FE = 1 / np.sqrt(np.sum(weights))
-        
-        # Random-effects (DerSimonian-Laird)
-        Q = np.sum(weights * (delta_true - mu_FE)**2)
-        k = len(delta_true)
-        C = np.sum(weights) - np.sum(weights**2) / np.sum(weights)
-        tau2_between = max(0, (Q - (k - 1)) / C)
-        
-        weights_RE = 1 / (delta_true_se**2 + tau2_between)
-        mu_RE = np.sum(weights_RE * delta_true) / np.sum(weights_RE)
-        se_RE = 1 / np.sqrt(np.sum(weights_RE))
+        # Meta-analysis of delta_true (fixed-effect + DerSimonian-Laird)
+        combined = combine(delta_true, delta_true_se, method='DL')
         
         return {
             'delta_true_values': delta_true,
             'delta_true_se_values': delta_true_se,
             'phi_optimal': phi_optimal,
-            'mu_FE': mu_FE,
-            'se_FE': se_FE,
-            'mu_RE': mu_RE, 
-            'se_RE': se_RE,
-            'tau2_between': tau2_between,
-            'Q': Q,
-            'k': k
+            'mu_FE': combined['mu_FE'][()],
+            'se_FE': combined['se_FE'][()],
+            'mu_RE': combined['mu_RE'][()], 
+            'se_RE': combined['se_RE'][()],
+            'tau2_between': combined['tau2'][()],
+            'Q': combined['Q'][()],
+            'k': int(combined['k'])
         }
     
     def run_full_mapping(self, results_df):
@@ -212,7 +370,11 @@ class PlatformMapper:
         
         # Fit optimal phi values
         print(f"\nFitting phi parameters...")
-        phi_optimal, final_objective = self.fit_phi_values(platform_data)
+        if self.meta_config.get('multi_start', {}).get('enabled', False):
+            phi_optimal, final_objective, self.basins = self.fit_phi_multistart(platform_data)
+            print(self.basins.head(5).to_string(index=False, float_format='%.4f'))
+        else:
+            phi_optimal, final_objective = self.fit_phi_values(platform_data)
         
         print("Optimal phi values:")
         for i, (_, row) in enumerate(platform_data.iterrows()):
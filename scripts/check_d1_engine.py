@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+D1 engine regression checks for QH Project CI.
+
+Compares the fast kernels in analysis/d1_engine.py with the reference
+implementations in analysis/fit_d1.py on seeded random series, so the
+exhaustive window search stays the ground truth for the incremental one,
+checks that the serial and batch drivers order tied S values alike,
+checks that the point-level bootstrap of μ_FE reproduces the analytic
+SE on well-behaved data, and checks that CSV tables survive a round trip
+through .npz with their missing values intact.
+
+Usage:
+    python scripts/check_d1_engine.py [--n-series 500] [--seed 0]
+"""
+
+import argparse
+import pathlib
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "analysis"))
+
+import fit_d1
+from d1_bootstrap import bootstrap_combined, bootstrap_summary
+from d1_engine import batch_protection_windows, find_protection_window, fit_series_batch
+from d1_io import read_table, write_table
+
+
+def random_series(rng, max_points=25):
+    """
+    One random (S_norm, tau) series sorted by S_norm
+    Mixes power-law slopes of either sign, tied S values and NaN taus
+    """
+    n = int(rng.integers(0, max_points + 1))
+    if rng.random() < 0.3:
+        # Few distinct S values -> ties
+        S = rng.choice(10 ** rng.uniform(-1, 2, size=4), size=n)
+    else:
+        S = 10 ** rng.uniform(-1, 2, size=n)
+    delta = rng.uniform(-1, 1)
+    tau = S ** delta * np.exp(rng.normal(0, rng.uniform(0.05, 1.0), size=n))
+    tau[rng.random(n) < 0.05] = np.nan
+    order = np.argsort(S, kind="stable")
+    return S[order], tau[order]
+
+
+def exhaustive_bounds(S, tau):
+    """(start, end) of select_protection_window_exhaustive, or None"""
+    df = pd.DataFrame({"S_norm": S, "tau": tau})
+    window = fit_d1.select_protection_window_exhaustive(df)
+    if window is None:
+        return None
+    return int(window.index[0]), int(window.index[-1]) + 1
+
+
+def check_protection_window(n_series, seed):
+    """
+    find_protection_window and batch_protection_windows vs the exhaustive search
+    Returns the number of mismatching series
+    """
+    rng = np.random.default_rng(seed)
+    config = fit_d1.fit_config()
+    args = (config["min_points"], config["min_log_range_x"],
+            config["min_log_range_y"], config["neg_slope_threshold"])
+    eps = config["eps"]
+
+    mismatches = 0
+    n_found = 0
+    for i in range(n_series):
+        S, tau = random_series(rng)
+        expected = exhaustive_bounds(S, tau)
+        n_found += expected is not None
+
+        x = np.log(S + eps)
+        y = np.log(tau + eps)
+        incremental = find_protection_window(x, y, *args)
+
+        batch = None
+        if len(x) > 0:
+            s, e = batch_protection_windows(x[None], y[None], [len(x)], *args)
+            batch = None if s[0] < 0 else (int(s[0]), int(e[0]))
+
+        if incremental != expected or batch != expected:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"   ❌ series {i} (n={len(S)}): exhaustive {expected}, "
+                      f"incremental {incremental}, batch {batch}")
+
+    print(f"   protection window: {n_series - mismatches}/{n_series} series agree "
+          f"({n_found} with a window)")
+    return mismatches
+
+
+def check_serial_vs_batch(n_series, seed):
+    """
+    fit_all_series_serial (pandas sort per series) vs fit_all_series_arrays
+    (one lexsort) on series with tied S values; both must order ties by row
+    and so pick the same windows. Returns the number of mismatching series
+    """
+    rng = np.random.default_rng(seed)
+    parts = []
+    for i in range(n_series):
+        S, tau = random_series(rng)
+        shuffle = rng.permutation(len(S))
+        parts.append(pd.DataFrame({"system_id": f"s{i}", "env_tag": "lab",
+                                   "S_norm": S[shuffle], "tau": tau[shuffle],
+                                   "tau_err": 0.1 * tau[shuffle]}))
+    points = pd.concat(parts, ignore_index=True)
+
+    serial = fit_d1.fit_all_series_serial(points)
+    batch = fit_d1.fit_all_series_arrays(points)
+    mismatches = 0
+    for key, a in serial.items():
+        b = batch[key]
+        if a.window_tau is None or b.window_tau is None:
+            same = a.window_tau is None and b.window_tau is None
+        else:
+            same = np.array_equal(a.window_tau, b.window_tau, equal_nan=True)
+        mismatches += not same
+    print(f"   serial vs batch: {len(serial) - mismatches}/{len(serial)} series agree")
+    return mismatches
+
+
+def check_bootstrap_se(seed, n_boot=1000, k=12, n_points=40, rtol=0.2):
+    """
+    Point-level bootstrap SE of μ_FE vs the analytic se_FE on well-behaved
+    data (k clean power laws, δ = 0.5, 10% scatter, no duplicates)
+    Returns the number of failed conditions
+    """
+    rng = np.random.default_rng(seed)
+    S = np.sort(10 ** rng.uniform(0, 2, size=(k, n_points)), axis=1)
+    tau = S ** 0.5 * np.exp(rng.normal(0, 0.1, size=S.shape))
+    S, tau = S.ravel(), tau.ravel()
+    tau_err = 0.1 * tau
+    offsets = np.arange(k + 1) * n_points
+
+    config = fit_d1.fit_config()
+    _, _, slopes, ses, ok = fit_series_batch(S, tau, tau_err, offsets, **config)
+    combined = fit_d1.combine_effects(slopes[ok], ses[ok])
+    boot = bootstrap_combined(S, tau, tau_err, offsets, n_boot, level='points',
+                              seed=seed, **config)
+    row = bootstrap_summary(boot, slopes[ok], ses[ok], combined, max_fail_fraction=0.0)[0]
+
+    ratio = row['boot_se'] / combined['se_FE']
+    print(f"   bootstrap: μ_FE SE {row['boot_se']:.4f} vs analytic {combined['se_FE']:.4f} "
+          f"(ratio {ratio:.2f}), {row['n_failed']} failed replicates")
+    return int(not ok.all()) + int(abs(ratio - 1) > rtol)
+
+
+def check_npz_round_trip():
+    """
+    CSV -> .npz -> CSV on a table with missing numbers and missing text
+    Returns the number of failed conditions
+    """
+    df = pd.DataFrame({"system_id": ["a", "b", "c"],
+                       "env_tag": ["lab", None, "field"],
+                       "S_norm": [1.0, np.nan, 3.0]})
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = pathlib.Path(tmp)
+        df.to_csv(tmp / "in.csv", index=False)
+        write_table(read_table(tmp / "in.csv"), tmp / "table.npz")
+        write_table(read_table(tmp / "table.npz"), tmp / "out.csv")
+        back = read_table(tmp / "out.csv")
+        subset = read_table(tmp / "table.npz", columns=["env_tag"])
+
+    same = (list(back.columns) == list(df.columns)
+            and back.isna().equals(df.isna())
+            and back.fillna("").astype(str).equals(df.fillna("").astype(str))
+            and subset["env_tag"].isna().tolist() == [False, True, False])
+    print(f"   npz round trip: {'ok' if same else 'values changed'} "
+          f"({int(back.isna().to_numpy().sum())} missing values)")
+    return int(not same)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='D1 engine regression checks')
+    parser.add_argument("--n-series", type=int, default=500,
+                        help="Random series per check")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    print("🔍 Checking D1 engine against reference implementations...")
+    failures = check_protection_window(args.n_series, args.seed)
+    failures += check_serial_vs_batch(args.n_series, args.seed)
+    failures += check_bootstrap_se(args.seed)
+    failures += check_npz_round_trip()
+
+    if failures:
+        print(f"💥 {failures} failed checks")
+        sys.exit(1)
+    print("✅ D1 engine checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+MIDIS Data Gate - Batch runner for many flux-bin files
+Gates every filter/field of a data drop in one go
+
+Inputs are globs and/or a manifest (one path per line, or a CSV with a
+'path' column; any other manifest columns such as filter or field are
+copied into the records). Files are validated concurrently with
+midis_data_gate.validate_file(). Each run gets a batch id (its start time)
+and each input gets its own <prefix>_summary.json / <prefix>_two_point.csv
+(and optional plot) in <output-dir>/<batch id>/, so later drops never
+overwrite earlier artifacts. One JSON record per input is appended to a
+JSON-lines summary as soon as it finishes, with non-finite numbers (e.g.
+the fit error of a 1-bin file) written as null. Unreadable inputs are
+recorded with status ERROR instead of stopping the batch.
+
+Usage:
+    python scripts/midis_gate_batch.py "data/drop3/*_flux_bins.csv" --jobs 8
+    python scripts/midis_gate_batch.py --manifest drop3_manifest.csv --executor process --plot
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from midis_data_gate import validate_file, write_gate_artifacts
+
+
+def read_manifest(manifest_path):
+    """[(path, metadata dict)] from a path-per-line list or a CSV with a 'path' column"""
+    manifest_path = Path(manifest_path)
+    lines = [l.strip() for l in manifest_path.read_text().splitlines()]
+    lines = [l for l in lines if l and not l.startswith('#')]
+    if not lines:
+        return []
+
+    if 'path' in [c.strip() for c in lines[0].split(',')]:
+        df = pd.read_csv(manifest_path, comment='#', dtype=str).fillna('')
+        entries = []
+        for row in df.to_dict('records'):
+            path = row.pop('path').strip()
+            entries.append((path, {k: v for k, v in row.items() if v != ''}))
+    else:
+        entries = [(l, {}) for l in lines]
+
+    # Relative manifest paths are taken from the manifest's directory
+    return [(str(p) if Path(p).is_absolute() or Path(p).exists() else str(manifest_path.parent / p), meta)
+            for p, meta in entries]
+
+
+def collect_inputs(patterns=(), manifest=None):
+    """Expand globs and manifest into unique (path, metadata) pairs, in order"""
+    entries = read_manifest(manifest) if manifest else []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        # Keep literal paths that match nothing so they are reported as errors
+        entries += [(m, {}) for m in (matches or [pattern])]
+
+    seen, unique = set(), []
+    for path, meta in entries:
+        key = str(Path(path).resolve())
+        if key not in seen:
+            seen.add(key)
+            unique.append((path, meta))
+    return unique
+
+
+def artifact_prefixes(paths):
+    """
+    Per-input artifact prefixes: the file stem, or the path relative to the
+    inputs' common directory when stems collide (same filter in two fields)
+    """
+    stems = [Path(p).with_suffix('').name for p in paths]
+    resolved = [Path(p).resolve().with_suffix('') for p in paths]
+    common = Path(os.path.commonpath(resolved)) if len(resolved) > 1 else None
+
+    prefixes = []
+    for stem, full in zip(stems, resolved):
+        if stems.count(stem) > 1 and common is not None:
+            stem = "__".join(full.relative_to(common).parts)
+        prefixes.append(stem)
+    return prefixes
+
+
+def json_safe(value):
+    """Copy of a record with NaN/inf replaced by None (null), which JSON lacks"""
+    if isinstance(value, dict):
+        return {k: json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(v) for v in value]
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def new_batch_dir(output_dir):
+    """(batch id, directory) for this run: start time, suffixed if already taken"""
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    for n in range(1000):
+        batch_id = stamp if n == 0 else f"{stamp}_{n}"
+        try:
+            (output_dir / batch_id).mkdir(parents=True)
+            return batch_id, output_dir / batch_id
+        except FileExistsError:
+            continue
+    raise RuntimeError(f"Could not create a batch directory under {output_dir}")
+
+
+def _fmt(value, spec):
+    return "n/a" if value is None else format(value, spec)
+
+
+def gate_one(csv_path, output_dir, prefix, plot=False):
+    """Validate one input and write its artifacts; returns a JSON-ready record"""
+    record = {"input": str(csv_path), "prefix": prefix}
+    start = time.time()
+    try:
+        result = validate_file(csv_path)
+        paths = write_gate_artifacts(result, output_dir, prefix)
+        if plot:
+            import matplotlib
+            matplotlib.use('Agg')
+            import matplotlib.pyplot as plt
+            from midis_data_gate import plot_gate
+            paths["plot"] = Path(output_dir) / f"{prefix}_plot.pdf"
+            plt.close(plot_gate(result, paths["plot"]))
+        record.update(result.summary())
+        record["artifacts"] = {k: str(v) for k, v in paths.items()}
+    except Exception as e:
+        record.update({"validation_status": "ERROR", "error": f"{type(e).__name__}: {e}"})
+    record["elapsed_s"] = round(time.time() - start, 4)
+    return record
+
+
+def run_batch(entries, output_dir="artifacts/data/gate_batch", summary_path=None,
+              jobs=4, executor="thread", plot=False):
+    """
+    Gate (path, metadata) entries concurrently
+
+    Artifacts go to <output_dir>/<batch id>/. Appends one JSON line per
+    input to summary_path (default <output_dir>/gate_summary.jsonl) in
+    completion order and returns the records in input order.
+    """
+    output_dir = Path(output_dir)
+    batch_id, batch_dir = new_batch_dir(output_dir)
+    summary_path = Path(summary_path) if summary_path else output_dir / "gate_summary.jsonl"
+    summary_path.parent.mkdir(parents=True, exist_ok=True)
+
+    paths = [p for p, _ in entries]
+    prefixes = artifact_prefixes(paths)
+    batch_time = time.strftime("%Y-%m-%dT%H:%M:%S")
+    pool_cls = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+
+    records = [None] * len(entries)
+    with pool_cls(max_workers=max(jobs, 1)) as pool, open(summary_path, 'a') as out:
+        futures = {pool.submit(gate_one, path, batch_dir, prefix, plot): i
+                   for i, (path, prefix) in enumerate(zip(paths, prefixes))}
+        for future in as_completed(futures):
+            i = futures[future]
+            record = json_safe({"batch_id": batch_id, "batch_time": batch_time,
+                                **entries[i][1], **future.result()})
+            out.write(json.dumps(record, allow_nan=False) + "\n")
+            out.flush()
+            records[i] = record
+
+            status = record["validation_status"]
+            icon = {"PASS": "✅", "FAIL": "❌"}.get(status, "💥")
+            detail = (f"k = {_fmt(record['k_fit'], '.3f')} ± {_fmt(record['k_fit_err'], '.3f')} "
+                      f"({_fmt(record['sigma_deviation'], '.2f')}σ)" if "k_fit" in record else record["error"])
+            print(f"   {icon} {record['prefix']}: {status} {detail}")
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the MIDIS data gate over many flux-bin files')
+    parser.add_argument('inputs', nargs='*', help='Flux-bin CSV paths or globs (quote globs)')
+    parser.add_argument('--manifest', default=None,
+                        help="Path list, or CSV with a 'path' column plus metadata (filter, field...)")
+    parser.add_argument('--output-dir', default='artifacts/data/gate_batch',
+                        help='Directory for per-batch artifact subdirectories')
+    parser.add_argument('--summary', default=None,
+                        help='JSON-lines summary to append to (default <output-dir>/gate_summary.jsonl)')
+    parser.add_argument('--jobs', type=int, default=4, help='Concurrent workers')
+    parser.add_argument('--executor', choices=['thread', 'process'], default='thread',
+                        help='Worker pool type')
+    parser.add_argument('--plot', action='store_true', help='Also save a diagnostic plot per input')
+    args = parser.parse_args()
+
+    if args.plot and args.executor == 'thread':
+        parser.error('--plot needs --executor process (pyplot is not thread-safe)')
+
+    entries = collect_inputs(args.inputs, args.manifest)
+    if not entries:
+        parser.error('no inputs: give paths/globs or --manifest')
+
+    print("🚪 MIDIS Data Gate - Batch")
+    print("=" * 50)
+    print(f"🔍 Validating {len(entries)} inputs ({args.jobs} {args.executor} workers)")
+
+    records = run_batch(entries, args.output_dir, args.summary, args.jobs, args.executor, args.plot)
+
+    n_pass = sum(r["validation_status"] == "PASS" for r in records)
+    n_error = sum(r["validation_status"] == "ERROR" for r in records)
+    summary_path = args.summary or str(Path(args.output_dir) / "gate_summary.jsonl")
+    print(f"\n📋 {n_pass}/{len(records)} passed, {len(records) - n_pass - n_error} failed, "
+          f"{n_error} errors")
+    print(f"💾 Appended {len(records)} records to {summary_path}")
+    print("=" * 50)
+    sys.exit(0 if n_pass == len(records) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,15 @@
 Notebook Smoke Test Runner for QH Project CI.
 
 This script runs all notebooks with papermill to ensure they execute 
-without errors using real data dependencies.
+without errors using real data dependencies, then runs the analysis
+module CLIs that replaced notebook loops (e.g. the MIDIS k MCMC).
 
 Usage:
-    python scripts/run_notebooks_smoke.py [--timeout 300]
+    python scripts/run_notebooks_smoke.py [--timeout 300] [--k-fit-steps 20000]
 """
 
 import argparse
+import importlib.util
 import subprocess
 import sys
 import pathlib
@@ -69,12 +71,47 @@ def run_notebook_smoke(notebook_path: pathlib.Path, output_path: pathlib.Path,
         return False
 
 
+def run_script_smoke(name: str, cmd: List[str], timeout: int = 300) -> bool:
+    """
+    Run an analysis module CLI as a smoke test.
+    
+    Args:
+        name: Label for the report
+        cmd: Command line (without the interpreter)
+        timeout: Max execution time in seconds
+        
+    Returns:
+        True if successful, False if failed
+    """
+    print(f"🧪 Running smoke test: {name}")
+    print(f"   Command: {' '.join(cmd)}")
+    
+    try:
+        start_time = time.time()
+        result = subprocess.run([sys.executable] + cmd, capture_output=True, text=True, timeout=timeout)
+        elapsed = time.time() - start_time
+        
+        if result.returncode == 0:
+            print(f"   ✅ PASS ({elapsed:.1f}s)")
+            return True
+        else:
+            print(f"   ❌ FAIL ({elapsed:.1f}s)")
+            print(f"   Error: {result.stderr}")
+            return False
+            
+    except subprocess.TimeoutExpired:
+        print(f"   ⏰ TIMEOUT ({timeout}s)")
+        return False
+
+
 def main():
     parser = argparse.ArgumentParser(description='Run notebook smoke tests')
     parser.add_argument("--timeout", type=int, default=300,
                        help="Timeout per notebook in seconds")
     parser.add_argument("--output-dir", default="artifacts/checks/notebooks",
                        help="Output directory for executed notebooks")
+    parser.add_argument("--k-fit-steps", type=int, default=20000,
+                       help="MCMC steps for the MIDIS k fit module check")
     args = parser.parse_args()
     
     # Define notebooks and their parameters
@@ -159,6 +196,30 @@ def main():
         )
         results.append(success)
     
+    # Module checks (fast kernels vs reference code, vectorized replacements of notebook samplers)
+    scripts_config = [
+        {
+            "name": "check_d1_engine.py",
+            "cmd": ["scripts/check_d1_engine.py"]
+        },
+        {
+            "name": "midis_k_fit.py",
+            "requires": ["h5py"],  # optional dependency, for the --chain checkpoint
+            "cmd": ["analysis/midis_k_fit.py", "--data", "data/midis_f560w_masslim.csv",
+                    "--scatter", "--n_steps", str(args.k_fit_steps), "--no_resume",
+                    "--chain", str(output_dir / "midis_k_chain.h5"),
+                    "--out", str(output_dir / "midis_k_fit.json")]
+        }
+    ]
+    
+    print(f"\n🧪 Running {len(scripts_config)} module smoke tests...")
+    for config in scripts_config:
+        missing = [m for m in config.get("requires", []) if importlib.util.find_spec(m) is None]
+        if missing:
+            print(f"⏭️  Skipping {config['name']}: optional dependency not installed ({', '.join(missing)})")
+            continue
+        results.append(run_script_smoke(config["name"], config["cmd"], args.timeout))
+    
     # Summary
     passed = sum(results)
     total = len(results)